@@ -1,19 +1,62 @@
-import streamlit as st
-import fastf1
+import time
+# Start of this script run, including the imports below, for the rerun timing
+_run_start = time.perf_counter()
+
+import importlib
 import os
-from pages.home import show_home_page
-from pages.telemetry import show_telemetry_page
-from pages.comparison import show_comparison_page
-from pages.position_changes import show_position_changes_page
-from pages.lap_distribution import show_lap_distribution_page
-from pages.gear_shift import show_gear_shift_page
-# Create cache directory if it doesn't exist
-cache_dir = 'cache'
-if not os.path.exists(cache_dir):
-    os.makedirs(cache_dir)
-
-# Enable FastF1 cache
-fastf1.Cache.enable_cache(cache_dir)
+import sys
+
+import streamlit as st
+
+from tracing import span, tracer, start_metrics_server
+
+# Navigation entries and the function rendering each. A page module and its heavy
+# dependencies (fastf1, plotly, seaborn, matplotlib) are imported the first time
+# the page is shown, so the Home page renders without them.
+PAGES = {
+    "Home": 'pages.home:show_home_page',
+    "Telemetry Analysis": 'pages.telemetry:show_telemetry_page',
+    "Driver Comparison": 'pages.comparison:show_comparison_page',
+    "Position Changes": 'pages.position_changes:show_position_changes_page',
+    "Lap Time Distribution": 'pages.lap_distribution:show_lap_distribution_page',
+    "Gear Shift Analysis": 'pages.gear_shift:show_gear_shift_page',
+}
+
+# Pages that show no session data and need no FastF1 cache
+STATIC_PAGES = {"Home"}
+
+
+@st.cache_resource
+def init_process():
+    """One-time setup of the server process, skipped on every later rerun"""
+    # Create cache directory if it doesn't exist
+    os.makedirs('cache', exist_ok=True)
+    # Expose page timings to Prometheus when F1_METRICS_PORT is set
+    start_metrics_server()
+    # Keep the cache directory within F1_CACHE_BUDGET_MB, checked in the background
+    from cache_manager import start_budget_enforcer
+    start_budget_enforcer()
+
+
+@st.cache_resource
+def init_fastf1():
+    """Enable the FastF1 cache once, before the first page that loads session data"""
+    import fastf1
+    fastf1.Cache.enable_cache('cache')
+
+
+def get_page(name):
+    """Render function of a page, importing its module on first use"""
+    module_name, function = PAGES[name].split(':')
+    if module_name not in sys.modules:
+        with span('import_page', page=name):
+            importlib.import_module(module_name)
+    if name not in STATIC_PAGES:
+        init_fastf1()
+    return getattr(sys.modules[module_name], function)
+
+
+init_process()
 
 # Hide specific elements while keeping the Navigation section
 hide_menu = """
@@ -29,20 +72,41 @@ st.markdown(hide_menu, unsafe_allow_html=True)
 def main():
     # Create a navigation menu
     st.sidebar.title("Navigation")
-    pages = {
-        "Home": show_home_page,
-        "Telemetry Analysis": show_telemetry_page,
-        "Driver Comparison": show_comparison_page,
-        "Position Changes": show_position_changes_page,
-        "Lap Time Distribution": show_lap_distribution_page,
-        "Gear Shift Analysis": show_gear_shift_page
-    }
     
     # Let the user select the page
-    selection = st.sidebar.radio("Go to", list(pages.keys()))
+    selection = st.sidebar.radio("Go to", list(PAGES.keys()))
     
     # Call the selected page function
-    pages[selection]()
+    get_page(selection)()
+    
+    # Show shared cache counters so the memory ceilings can be sized. Only caches
+    # of modules some page already imported are shown, the Home page imports none.
+    session_cache = sys.modules.get('session_cache')
+    if session_cache is not None:
+        with st.sidebar.expander("Session Cache"):
+            st.json(session_cache.session_cache.stats())
+            st.caption("Lap telemetry")
+            st.json(sys.modules['telemetry_store'].telemetry_cache.stats())
+            st.caption("Decoded lap telemetry")
+            st.json(sys.modules['telemetry_store'].decoded_telemetry_cache.stats())
+            if 'figure_cache' in sys.modules:
+                st.caption("Figures")
+                st.json(sys.modules['figure_cache'].figure_cache.stats())
+    
+    # Show how much chart payload the downsampling layer saved
+    downsampling = sys.modules.get('downsampling')
+    if downsampling is not None and downsampling.chart_reports():
+        with st.sidebar.expander("Chart Payload"):
+            st.json(dict(downsampling.chart_reports()))
+    
+    # Time of this whole script run, imports included
+    tracer.record('rerun', time.perf_counter() - _run_start, {'page': selection})
+    
+    # Show where render time goes per page and stage
+    timings = tracer.summary()
+    if timings:
+        with st.sidebar.expander("Page Timings"):
+            st.json(timings)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,165 @@
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+_logger = logging.getLogger(__name__)
+
+ANALYSES = ['telemetry', 'distribution', 'positions', 'gears']
+
+# Position changes only make sense for sessions run as a race
+RACE_SESSIONS = ['R', 'S']
+
+# Analyses that need car and position data on top of lap timing
+_TELEMETRY_ANALYSES = {'telemetry', 'gears'}
+
+# In-memory cache budgets of each worker process, a worker handles one session at a time
+WORKER_CACHE_ENV = {'F1_SESSION_CACHE_MB': '256', 'F1_TELEMETRY_CACHE_MB': '32',
+                    'F1_DECODED_TELEMETRY_CACHE_MB': '8'}
+
+
+def _init_worker():
+    # Runs before the worker imports the caches, which read their budgets on import
+    for name, value in WORKER_CACHE_ENV.items():
+        os.environ[name] = value
+
+
+def fastest_lap_telemetry(session):
+    """Fastest lap telemetry of every driver as one frame with a Driver column"""
+    from lap_table import get_lap_table
+    from telemetry_store import get_lap_telemetry
+
+    lap_table = get_lap_table(session)
+    frames = []
+    for drv in lap_table.drivers:
+        fastest_lap = lap_table.fastest_lap(session, drv)
+        if fastest_lap is None:
+            continue
+        # The cached telemetry is shared and read-only, assign returns a new frame
+        telemetry = get_lap_telemetry(session, fastest_lap)
+        frames.append(telemetry.assign(Driver=fastest_lap['Driver'], LapNumber=int(fastest_lap['LapNumber']))
+                      [['Driver', 'LapNumber'] + list(telemetry.columns)])
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def analyse_session(year, event, session_type, analyses, out_dir):
+    """Run the selected analyses for one session and write their results to out_dir
+
+    Runs in a worker process, so everything it needs is imported here.
+    """
+    import fastf1
+    import matplotlib
+    matplotlib.use('Agg')
+
+    from session_cache import load_session, session_cache
+    from telemetry_store import decoded_telemetry_cache, telemetry_cache
+
+    fastf1.Cache.enable_cache('cache')
+    profile = 'telemetry' if _TELEMETRY_ANALYSES & set(analyses) else 'laps'
+    try:
+        return _write_analyses(load_session(year, event, session_type, profile=profile),
+                               year, event, session_type, analyses, out_dir)
+    finally:
+        # The next session of this worker never reuses this one, free it before loading that one
+        session_cache.clear()
+        telemetry_cache.clear()
+        decoded_telemetry_cache.clear()
+
+
+def _write_analyses(session, year, event, session_type, analyses, out_dir):
+    import matplotlib.pyplot as plt
+
+    from telemetry_store import session_id
+
+    session_dir = os.path.join(out_dir, session_id(session))
+    os.makedirs(session_dir, exist_ok=True)
+    written = []
+
+    telemetry = None
+    if _TELEMETRY_ANALYSES & set(analyses):
+        telemetry = fastest_lap_telemetry(session)
+
+    if 'telemetry' in analyses and not telemetry.empty:
+        path = os.path.join(session_dir, 'fastest_lap_telemetry.parquet')
+        telemetry.to_parquet(path, index=False)
+        written.append(path)
+
+    if 'distribution' in analyses:
+        from lap_stats import get_lap_stats
+        stats = get_lap_stats(session)
+        for level, table in stats.aggregates.items():
+            path = os.path.join(session_dir, f"lap_stats_{level}.parquet")
+            table.to_parquet(path, index=False)
+            written.append(path)
+
+    if 'positions' in analyses and session_type in RACE_SESSIONS:
+        from positions import get_position_matrix
+        matrix = get_position_matrix(session)
+        path = os.path.join(session_dir, 'positions.json')
+        with open(path, 'w') as f:
+            json.dump({
+                'drivers': matrix.drivers,
+                'laps': matrix.laps.tolist(),
+                # NaN is not valid JSON, missing positions are written as null
+                'positions': [[None if pd.isna(p) else int(p) for p in row] for row in matrix.positions],
+                'changes': json.loads(matrix.changes().to_json(orient='records')),
+            }, f)
+        written.append(path)
+
+    if 'gears' in analyses and not telemetry.empty:
+        from gear_map import create_gear_map_figure
+        for drv, lap_telemetry in telemetry.groupby('Driver', sort=False):
+            fig = create_gear_map_figure(lap_telemetry, f"Fastest Lap Gear Shift Visualization\n{drv} - {event} {year}")
+            path = os.path.join(session_dir, f"gear_map_{drv}.png")
+            fig.savefig(path, dpi=100)
+            plt.close(fig)
+            written.append(path)
+
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run dashboard analyses headless for a season or a list of events")
+    parser.add_argument('year', type=int)
+    parser.add_argument('events', nargs='*', help="Event names, defaults to the whole season")
+    parser.add_argument('--sessions', nargs='+', default=['R'], help="Session identifiers, e.g. Q R")
+    parser.add_argument('--analyses', nargs='+', default=ANALYSES, choices=ANALYSES)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--out', default='results', help="Output directory")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    import fastf1
+    from schedule_index import get_schedule_index
+
+    os.makedirs('cache', exist_ok=True)
+    fastf1.Cache.enable_cache('cache')
+    index = get_schedule_index()
+    events = args.events or [name for name in index.event_names(args.year)
+                             if index.round_number(args.year, name) > 0]
+    tasks = [(args.year, event, session_type) for event in events for session_type in args.sessions]
+
+    start = time.perf_counter()
+    completed = 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as executor:
+        futures = {executor.submit(analyse_session, *task, args.analyses, args.out): task for task in tasks}
+        for future in as_completed(futures):
+            year, event, session_type = futures[future]
+            try:
+                written = future.result()
+                completed += 1
+                _logger.info("%s %s %s: %d files", year, event, session_type, len(written))
+            except Exception as e:
+                _logger.warning("%s %s %s failed: %s", year, event, session_type, e)
+
+    minutes = (time.perf_counter() - start) / 60
+    print(f"{completed}/{len(tasks)} sessions in {minutes:.1f} min "
+          f"({completed / minutes if minutes else 0:.1f} sessions/min with {args.workers} workers)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Benchmark results of every run, newest last, so regressions show up between commits.
+# Kept in the cache directory, which git ignores
+HISTORY_PATH = os.path.join(REPO_DIR, 'cache', 'bench_history.json')
+
+# Wall time is split into these stages, 'figure' is whatever the page does between the others
+STAGES = ['schedule', 'load', 'telemetry', 'figure', 'serialize']
+
+# Page functions and the widget state pinning them to the fixture session. Widgets without a
+# key keep their first option, buttons listed under 'click' are pressed before measuring.
+PAGES = {
+    'telemetry': {
+        'function': 'pages.telemetry:show_telemetry_page',
+        'state': {'telemetry_session': 'Race'},
+    },
+    'comparison': {
+        'function': 'pages.comparison:show_comparison_page',
+        'state': {'comparison_session': 'Race'},
+    },
+    'position_changes': {
+        'function': 'pages.position_changes:show_position_changes_page',
+        'state': {},
+    },
+    'lap_distribution': {
+        'function': 'pages.lap_distribution:show_lap_distribution_page',
+        'state': {},
+        'click': 'Generate Distribution Plot',
+    },
+    'gear_shift': {
+        'function': 'pages.gear_shift:show_gear_shift_page',
+        'state': {},
+        'click': 'Generate Gear Shift Visualization',
+    },
+}
+
+# Modules the Home page is expected to render without
+HEAVY_MODULES = ['fastf1', 'plotly', 'seaborn', 'matplotlib', 'pyarrow']
+
+# Page module globals timed as a stage, whichever of them the page imports
+_STAGE_FUNCTIONS = {
+    'schedule': ['get_event_names'],
+    'load': ['load_session'],
+    'telemetry': ['get_lap_telemetry', 'get_laps_telemetry', 'resample_laps', 'get_position_matrix', 'get_lap_stats'],
+}
+
+_SCRIPT = """import streamlit as st
+from {module} import {function}
+
+for key, value in {state!r}.items():
+    st.session_state.setdefault(key, value)
+
+{function}()
+"""
+
+
+class StageTimer:
+    """Accumulates the wall time spent in wrapped functions per stage"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.timings = dict.fromkeys(STAGES + ['total'], 0.0)
+
+    def wrap(self, stage, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.timings[stage] += time.perf_counter() - start
+        return timed
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _setup_runtime():
+    """Install the in-memory runtime Streamlit's script runner tests use"""
+    from unittest.mock import MagicMock
+
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+
+    config.set_option('runner.postScriptGC', False)
+    storage = MemoryMediaFileStorage('/media')
+    # Count media bytes on every add, the storage itself keeps a single copy of identical files
+    storage.added_bytes = 0
+    load_and_get_id = storage.load_and_get_id
+
+    def counting_load_and_get_id(path_or_data, *args, **kwargs):
+        if isinstance(path_or_data, bytes):
+            storage.added_bytes += len(path_or_data)
+        return load_and_get_id(path_or_data, *args, **kwargs)
+
+    storage.load_and_get_id = counting_load_and_get_id
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(storage)
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+    return storage
+
+
+def _new_elements(messages):
+    for msg in messages:
+        if msg.HasField('delta') and msg.delta.WhichOneof('type') == 'new_element':
+            yield msg.delta.new_element
+
+
+def _errors(messages):
+    from streamlit.proto.Alert_pb2 import Alert
+
+    errors = []
+    for element in _new_elements(messages):
+        if element.WhichOneof('type') == 'exception':
+            errors.append(element.exception.message)
+        elif element.WhichOneof('type') == 'alert' and element.alert.format == Alert.ERROR:
+            errors.append(element.alert.body)
+    return errors
+
+
+def _payload_bytes(messages, sent_hashes):
+    """Bytes a browser would receive, counting messages it already cached as a reference
+
+    Mirrors Streamlit's forward message cache: messages of at least
+    ``global.minCachedMessageSize`` bytes are sent by hash once the session has them.
+    """
+    import hashlib
+
+    from streamlit import config
+
+    min_size = config.get_option('global.minCachedMessageSize')
+    total = 0
+    for msg in messages:
+        size = msg.ByteSize()
+        if size < min_size:
+            total += size
+            continue
+        content = type(msg)()
+        content.CopyFrom(msg)
+        content.ClearField('metadata')
+        digest = hashlib.md5(content.SerializeToString()).hexdigest()
+        total += len(digest) if digest in sent_hashes else size
+        sent_hashes.add(digest)
+    return total
+
+
+def _click(messages, label):
+    """Widget state pressing the button with the given label"""
+    from streamlit.proto.WidgetStates_pb2 import WidgetStates
+
+    button = next(element.button for element in _new_elements(messages)
+                  if element.WhichOneof('type') == 'button' and element.button.label == label)
+    widget_states = WidgetStates()
+    state = widget_states.widgets.add()
+    state.id = button.id
+    state.trigger_value = True
+    return widget_states
+
+
+def run_page(page, runs, timeout):
+    """Render a page once on a cold cache and ``runs`` more times warm, in this process"""
+    import importlib
+    import streamlit
+    from streamlit.runtime.scriptrunner import RerunData
+    from streamlit.testing.local_script_runner import LocalScriptRunner, require_widgets_deltas
+
+    storage = _setup_runtime()
+    spec = PAGES[page]
+    module_name, function = spec['function'].split(':')
+    module = importlib.import_module(module_name)
+
+    timer = StageTimer()
+    setattr(module, function, timer.wrap('total', getattr(module, function)))
+    for stage, names in _STAGE_FUNCTIONS.items():
+        for name in names:
+            if hasattr(module, name):
+                setattr(module, name, timer.wrap(stage, getattr(module, name)))
+    for name in ('plotly_chart', 'pyplot'):
+        setattr(streamlit, name, timer.wrap('serialize', getattr(streamlit, name)))
+
+    script_path = os.path.join(tempfile.mkdtemp(prefix='bench_'), f"{page}.py")
+    with open(script_path, 'w') as f:
+        f.write(_SCRIPT.format(module=module_name, function=function, state=spec['state']))
+
+    sent_hashes = set()
+
+    def render(session_state=None, widget_states=None):
+        timer.reset()
+        storage.added_bytes = 0
+        runner = LocalScriptRunner(script_path, session_state)
+        runner.request_rerun(RerunData(widget_states=widget_states))
+        runner.start()
+        require_widgets_deltas(runner, timeout)
+        messages = runner.forward_msgs()
+        payload = _payload_bytes(messages, sent_hashes) + storage.added_bytes
+        # Time the page function itself, the runner only reports completion every 100 ms
+        stages = dict(timer.timings)
+        total = stages.pop('total')
+        stages['figure'] = max(total - sum(stages.values()), 0.0)
+        return runner, {
+            'total_s': round(total, 4),
+            'stages_s': {stage: round(stages[stage], 4) for stage in STAGES},
+            'payload_kb': round(payload / 1024, 1),
+            'errors': _errors(messages),
+        }
+
+    # Cold: nothing cached in this process and an empty cache directory
+    runner, cold = render()
+    widget_states = None
+    if spec.get('click'):
+        widget_states = _click(runner.forward_msgs(), spec['click'])
+        runner, cold = render(runner.session_state, widget_states)
+    cold['peak_rss_mb'] = round(peak_rss_mb(), 1)
+
+    # Warm: the same selection again, served from the in-process and on-disk caches
+    warm_runs = [render(runner.session_state, widget_states)[1] for _ in range(runs)]
+    warm = {
+        'total_s': round(statistics.median(r['total_s'] for r in warm_runs), 4),
+        'stages_s': {stage: round(statistics.median(r['stages_s'][stage] for r in warm_runs), 4)
+                     for stage in STAGES},
+        'payload_kb': warm_runs[-1]['payload_kb'],
+        'errors': warm_runs[-1]['errors'],
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+    return {'cold': cold, 'warm': warm}
+
+
+def run_app(runs, timeout):
+    """Time the first paint of app.py's Home page in a fresh process and its warm reruns
+
+    Timings come from the 'rerun' span app.py records, which covers the whole
+    script run including its imports.
+    """
+    from streamlit.runtime.scriptrunner import RerunData
+    from streamlit.testing.local_script_runner import LocalScriptRunner, require_widgets_deltas
+    from tracing import tracer
+
+    _setup_runtime()
+
+    def render(session_state=None):
+        tracer.clear()
+        runner = LocalScriptRunner(os.path.join(REPO_DIR, 'app.py'), session_state)
+        runner.request_rerun(RerunData())
+        runner.start()
+        require_widgets_deltas(runner, timeout)
+        return runner, tracer.mean('rerun', 'Home'), _errors(runner.forward_msgs())
+
+    # Streamlit itself already imports some of them, count only what the app run added
+    preloaded = set(sys.modules)
+    runner, first_paint, errors = render()
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules and name not in preloaded]
+    reruns = [render(runner.session_state)[1] for _ in range(runs)]
+    return {
+        'first_paint_s': round(first_paint, 4),
+        'rerun_s': round(statistics.median(reruns), 4),
+        'heavy_modules': loaded,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'errors': errors,
+    }
+
+
+def bench_page(page, runs, source, timeout):
+    """Benchmark a page in a fresh interpreter and working directory so cold really is cold"""
+    env = dict(os.environ, F1_DATA_SOURCE=source, F1_PREFETCH_WORKERS='0',
+               F1_REPLAY_DIR=os.path.abspath(os.environ.get('F1_REPLAY_DIR', 'recordings')),
+               PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get('PYTHONPATH')])))
+    with tempfile.TemporaryDirectory(prefix='bench_cache_') as workdir:
+        result = subprocess.run(
+            [sys.executable, os.path.join(REPO_DIR, 'bench.py'), '--child', page,
+             '--runs', str(runs), '--timeout', str(timeout)],
+            cwd=workdir, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{page} benchmark failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def append_history(path, entry):
+    history = read_history(path) + [entry]
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(history, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def print_report(entry, previous):
+    print(f"{'page':<18}{'cold s':>9}{'warm s':>9}{'rss MB':>9}{'payload KB':>12}  vs {previous['commit'] if previous else '-'}")
+    for page, result in entry['pages'].items():
+        cold, warm = result['cold'], result['warm']
+        change = ''
+        before = previous and previous['pages'].get(page)
+        if before and before['warm']['total_s']:
+            change = f"warm {100 * (warm['total_s'] / before['warm']['total_s'] - 1):+.0f}%"
+        print(f"{page:<18}{cold['total_s']:>9.2f}{warm['total_s']:>9.2f}{warm['peak_rss_mb']:>9.0f}"
+              f"{warm['payload_kb']:>12.0f}  {change}")
+        stages = ', '.join(f"{stage} {cold['stages_s'][stage]:.2f}" for stage in STAGES)
+        print(f"{'':<18}cold stages: {stages}")
+        for error in cold['errors'] + warm['errors']:
+            print(f"{'':<18}error: {error}")
+    if 'app' in entry:
+        app = entry['app']
+        change = ''
+        before = previous and previous.get('app')
+        if before:
+            change = f"first paint {100 * (app['first_paint_s'] / before['first_paint_s'] - 1):+.0f}%"
+        print(f"{'app (Home)':<18}first paint {app['first_paint_s']:.3f} s, rerun {app['rerun_s']:.3f} s, "
+              f"rss {app['peak_rss_mb']:.0f} MB  {change}")
+        print(f"{'':<18}heavy modules imported: {', '.join(app['heavy_modules']) or 'none'}")
+        for error in app['errors']:
+            print(f"{'':<18}error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark page render time, memory and chart payload")
+    parser.add_argument('pages', nargs='*', default=list(PAGES), help="Pages to benchmark, defaults to all")
+    parser.add_argument('--runs', type=int, default=3, help="Warm runs per page")
+    parser.add_argument('--source', default='synthetic', choices=['synthetic', 'replay', 'fastf1'],
+                        help="Data source of the fixture session, see data_sources.py")
+    parser.add_argument('--history', default=HISTORY_PATH)
+    parser.add_argument('--timeout', type=float, default=600, help="Seconds allowed per page run")
+    parser.add_argument('--app', action='store_true', help="Also time the Home page's first paint through app.py")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == 'app':
+        print(json.dumps(run_app(args.runs, args.timeout)))
+        return
+    if args.child:
+        import fastf1
+        os.makedirs('cache', exist_ok=True)
+        fastf1.Cache.enable_cache('cache')
+        print(json.dumps(run_page(args.child, args.runs, args.timeout)))
+        return
+
+    unknown = set(args.pages) - set(PAGES)
+    if unknown:
+        parser.error(f"unknown pages: {', '.join(sorted(unknown))}")
+
+    entry = {
+        'commit': git_revision(),
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'source': args.source,
+        'runs': args.runs,
+        'pages': {page: bench_page(page, args.runs, args.source, args.timeout) for page in args.pages},
+    }
+    if args.app:
+        entry['app'] = bench_page('app', args.runs, args.source, args.timeout)
+    previous = next((e for e in reversed(read_history(args.history)) if e['source'] == args.source), None)
+    append_history(args.history, entry)
+    print_report(entry, previous)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pickle
+import re
+import shutil
+import sqlite3
+import threading
+import time
+
+import pyarrow as pa
+
+from shared_cache import SHARED_CACHE_DIR, shared_cache
+from telemetry_store import STORE_DIR, session_id
+from tracing import span
+
+_logger = logging.getLogger(__name__)
+
+# FastF1 cache directory the dashboard and the CLIs enable
+CACHE_DIR = 'cache'
+
+# Disk budget of everything under the cache directory
+DEFAULT_BUDGET_MB = int(os.environ.get('F1_CACHE_BUDGET_MB', '20480'))
+
+# Seconds between budget checks of the dashboard, 0 disables them
+CHECK_INTERVAL = int(os.environ.get('F1_CACHE_CHECK_INTERVAL', '600'))
+
+# Sessions used more recently than this many seconds ago are never evicted
+MIN_IDLE = 3600
+
+# Raw GET/POST responses FastF1 caches with requests-cache, expired after 12 hours
+HTTP_CACHE_FILE = 'fastf1_http_cache.sqlite'
+
+# Last use of each session, one empty marker file per session touched on every load
+ACCESS_DIR = os.path.join(SHARED_CACHE_DIR, 'access')
+
+# Temporary files older than this are left over from a crashed writer
+_STALE_TMP_SECONDS = 3600
+
+_DATE_PREFIX = re.compile(r'^\d{4}-\d{2}-\d{2}_')
+
+
+def _size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(dirpath, name)) for name in filenames)
+    return total
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def touch_session(session, access_dir=ACCESS_DIR):
+    """Mark a session as just used, its cached files are then the last to be evicted"""
+    path = os.path.join(access_dir, session_id(session))
+    os.makedirs(access_dir, exist_ok=True)
+    with open(path, 'a'):
+        os.utime(path)
+
+
+class CacheEntry:
+    """Cached files of one session: FastF1's parsed data and everything derived from it"""
+
+    def __init__(self, sid, year, event, session):
+        self.session_id = sid
+        self.year = year
+        self.event = event
+        self.session = session
+        self.raw_dir = None
+        self.api_path = None
+        self.paths = []  # derived files, removed together with the raw directory
+        self.size = 0
+        self.last_used = 0.0
+
+    def add(self, path, size=None):
+        self.size += _size(path) if size is None else size
+        self.last_used = max(self.last_used, os.path.getmtime(path))
+
+    def to_dict(self):
+        return {'session_id': self.session_id, 'year': self.year, 'event': self.event,
+                'session': self.session, 'size_mb': round(self.size / 1024 / 1024, 2),
+                'last_used': time.strftime('%Y-%m-%d %H:%M', time.localtime(self.last_used))}
+
+
+class CacheManager:
+    """Index of the cache directory with size reports, eviction, compaction and integrity checks
+
+    FastF1 keeps parsed API data as pickles under
+    ``<year>/<date>_<event>/<date>_<session>/`` and raw responses in one
+    requests-cache SQLite file. Derived artifacts live in the shared cache and
+    the telemetry store. Everything belonging to one session is grouped into a
+    ``CacheEntry`` by its ``session_id``, and evicted as a whole.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, shared=shared_cache, store_dir=STORE_DIR, access_dir=ACCESS_DIR):
+        self.cache_dir = cache_dir
+        self.shared = shared
+        self.store_dir = store_dir
+        self.access_dir = access_dir
+        self.http_cache_path = os.path.join(cache_dir, HTTP_CACHE_FILE)
+        self._lock = threading.Lock()
+
+    def _raw_session_dirs(self):
+        """(year, event, session, path) of every FastF1 session directory"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        for year in sorted(os.listdir(self.cache_dir)):
+            year_dir = os.path.join(self.cache_dir, year)
+            if not year.isdigit() or not os.path.isdir(year_dir):
+                continue
+            for event in sorted(os.listdir(year_dir)):
+                event_dir = os.path.join(year_dir, event)
+                if not os.path.isdir(event_dir):
+                    continue
+                for session in sorted(os.listdir(event_dir)):
+                    if os.path.isdir(os.path.join(event_dir, session)):
+                        yield (int(year), _DATE_PREFIX.sub('', event).replace('_', ' '),
+                               _DATE_PREFIX.sub('', session).replace('_', ' '),
+                               os.path.join(event_dir, session))
+
+    def scan(self):
+        """Cache entries of every session with cached files, least recently used first"""
+        entries = {}
+
+        def entry(sid, year=None, event=None, session=''):
+            if sid not in entries:
+                if year is None:
+                    # Derived data only, e.g. of the synthetic source, the names come from the id
+                    year = int(sid[:4]) if sid[:4].isdigit() else 0
+                    event = (sid[5:] if year else sid).replace('_', ' ')
+                entries[sid] = CacheEntry(sid, year, event, session)
+            return entries[sid]
+
+        for year, event, session, path in self._raw_session_dirs():
+            sid = re.sub(r'[^A-Za-z0-9]+', '_', f"{year}_{event}_{session}").strip('_')
+            e = entry(sid, year, event, session)
+            e.raw_dir = path
+            e.api_path = '/static/' + os.path.relpath(path, self.cache_dir).replace(os.sep, '/') + '/'
+            e.add(path)
+
+        if os.path.isdir(self.store_dir):
+            for name in os.listdir(self.store_dir):
+                if name.endswith('.arrow'):
+                    path = os.path.join(self.store_dir, name)
+                    e = entry(name[:-len('.arrow')])
+                    e.paths.append(path)
+                    e.add(path)
+
+        # An object shared by several keys is counted once, for the first of them
+        counted = set()
+        for ref_path, object_path, key in self.shared.refs():
+            if len(key) < 2 or object_path is None or not os.path.exists(object_path):
+                continue
+            e = entry(str(key[1]))
+            e.paths.append(ref_path)
+            size = 0 if object_path in counted else os.path.getsize(object_path)
+            counted.add(object_path)
+            e.add(ref_path, size)
+
+        for sid, e in entries.items():
+            marker = os.path.join(self.access_dir, sid)
+            if os.path.exists(marker):
+                e.paths.append(marker)
+                e.last_used = max(e.last_used, os.path.getmtime(marker))
+        return sorted(entries.values(), key=lambda e: e.last_used)
+
+    def _roots(self):
+        """Directories holding cached files, the shared cache may live outside the FastF1 cache"""
+        roots = [self.cache_dir]
+        shared_root = os.path.abspath(self.shared.root)
+        if os.path.commonpath([shared_root, os.path.abspath(self.cache_dir)]) != os.path.abspath(self.cache_dir):
+            roots.append(self.shared.root)
+        return [root for root in roots if os.path.isdir(root)]
+
+    def total_bytes(self):
+        return sum(_size(root) for root in self._roots())
+
+    def report(self, by='session'):
+        """Cached megabytes per season, event or session, plus the shared HTTP cache"""
+        sizes = {}
+        for e in self.scan():
+            parts = {'season': [e.year], 'event': [e.year, e.event], 'session': [e.year, e.event, e.session]}[by]
+            label = ' / '.join(str(part) for part in parts if part != '')
+            sizes[label] = sizes.get(label, 0) + e.size
+        report = {label: round(size / 1024 / 1024, 2) for label, size in sorted(sizes.items())}
+        if os.path.exists(self.http_cache_path):
+            report['HTTP cache'] = round(os.path.getsize(self.http_cache_path) / 1024 / 1024, 2)
+        report['total'] = round(self.total_bytes() / 1024 / 1024, 2)
+        return report
+
+    def _http_cache(self):
+        from requests_cache.backends.sqlite import SQLiteCache
+        return SQLiteCache(self.http_cache_path)
+
+    def evict(self, entries):
+        """Delete every cached file of some sessions, FastF1 downloads them again when next opened"""
+        for entry in entries:
+            if entry.raw_dir:
+                _remove(entry.raw_dir)
+            for path in entry.paths:
+                _remove(path)
+        api_paths = [entry.api_path for entry in entries if entry.api_path]
+        if api_paths and os.path.exists(self.http_cache_path):
+            # One pass over the stored responses for all sessions, each one is deserialized to get its URL
+            cache = self._http_cache()
+            keys = [response.cache_key for response in cache.filter()
+                    if any(api_path in response.url for api_path in api_paths)]
+            if keys:
+                cache.delete(*keys, vacuum=False)
+            cache.close()
+
+    def enforce_budget(self, budget_bytes, max_age=None, min_idle=MIN_IDLE):
+        """Evict least recently used sessions until the cache fits the budget
+
+        Sessions unused for more than ``max_age`` seconds are evicted whatever
+        the size. Returns the evicted entries.
+        """
+        with self._lock, self.shared.lock(('cache_manager',)):
+            now = time.time()
+            total = self.total_bytes()
+            evicted = []
+            for e in self.scan():
+                if now - e.last_used < min_idle:
+                    break
+                expired = max_age is not None and now - e.last_used > max_age
+                if total <= budget_bytes and not expired:
+                    continue
+                total -= e.size
+                evicted.append(e)
+            if evicted:
+                self.evict(evicted)
+                self.compact()
+            return evicted
+
+    def compact(self):
+        """Reclaim space without losing usable data, returns the bytes freed
+
+        Drops expired HTTP responses and vacuums the SQLite file, deletes shared
+        objects no key refers to any more, lock files nobody holds, stale
+        temporary files and empty directories. FastF1 reads its pickles with
+        plain ``pickle.load``, so they cannot be stored compressed.
+        """
+        before = self.total_bytes()
+        now = time.time()
+        if os.path.exists(self.http_cache_path):
+            cache = self._http_cache()
+            cache.delete(expired=True, vacuum=True)
+            cache.close()
+
+        # SharedCache.put writes an object before its ref, a recent unreferenced object may be about to get one
+        referenced = {object_path for _, object_path, _ in self.shared.refs() if object_path}
+        objects_dir = os.path.join(self.shared.root, 'objects')
+        if os.path.isdir(objects_dir):
+            for name in os.listdir(objects_dir):
+                path = os.path.join(objects_dir, name)
+                if (name.endswith('.arrow') and path not in referenced
+                        and now - os.path.getmtime(path) > _STALE_TMP_SECONDS):
+                    _remove(path)
+        self.shared.prune_locks()
+
+        # Directories are only removed once stale too, FastF1 creates a session's directory before writing to it
+        for root in self._roots():
+            for dirpath, _, filenames in os.walk(root, topdown=False):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    if name.endswith('.tmp') and now - os.path.getmtime(path) > _STALE_TMP_SECONDS:
+                        _remove(path)
+                if (dirpath != root and not os.listdir(dirpath)
+                        and now - os.path.getmtime(dirpath) > _STALE_TMP_SECONDS):
+                    os.rmdir(dirpath)
+        return before - self.total_bytes()
+
+    def verify(self, repair=False):
+        """(path, problem) of every corrupt cache file; ``repair`` deletes them so they are rebuilt"""
+        problems = []
+        for _, _, _, session_dir in self._raw_session_dirs():
+            for name in os.listdir(session_dir):
+                if not name.endswith('.ff1pkl'):
+                    continue
+                path = os.path.join(session_dir, name)
+                try:
+                    with open(path, 'rb') as f:
+                        cached = pickle.load(f)
+                    if not isinstance(cached, dict) or 'data' not in cached or 'version' not in cached:
+                        problems.append((path, "unexpected pickle contents"))
+                except Exception as e:
+                    problems.append((path, f"unreadable pickle: {e}"))
+
+        for ref_path, object_path, _ in self.shared.refs():
+            if object_path is None:
+                problems.append((ref_path, "unreadable or outdated ref"))
+            elif not os.path.exists(object_path):
+                problems.append((ref_path, "ref to a missing object"))
+        objects_dir = os.path.join(self.shared.root, 'objects')
+        if os.path.isdir(objects_dir):
+            for name in os.listdir(objects_dir):
+                if not name.endswith('.arrow'):
+                    continue
+                path = os.path.join(objects_dir, name)
+                # Objects are named by the hash of their bytes, so any change shows up
+                with open(path, 'rb') as f:
+                    digest = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+                if digest != name[:-len('.arrow')]:
+                    problems.append((path, "content does not match its hash"))
+
+        if os.path.isdir(self.store_dir):
+            for name in os.listdir(self.store_dir):
+                if not name.endswith('.arrow'):
+                    continue
+                path = os.path.join(self.store_dir, name)
+                try:
+                    with pa.memory_map(path, 'r') as source:
+                        table = pa.ipc.open_file(source).read_all()
+                        json.loads(table.schema.metadata[b'lap_index'])
+                except Exception as e:
+                    problems.append((path, f"unreadable telemetry store: {e}"))
+
+        if os.path.exists(self.http_cache_path):
+            try:
+                with sqlite3.connect(self.http_cache_path) as connection:
+                    result = connection.execute('PRAGMA integrity_check').fetchone()[0]
+                if result != 'ok':
+                    problems.append((self.http_cache_path, f"SQLite integrity check: {result}"))
+            except sqlite3.DatabaseError as e:
+                problems.append((self.http_cache_path, f"unreadable SQLite file: {e}"))
+
+        if repair:
+            for path, _ in problems:
+                _remove(path)
+        return problems
+
+
+# Module level instance shared by the dashboard
+cache_manager = CacheManager()
+
+_enforcer = None
+_enforcer_lock = threading.Lock()
+
+
+def start_budget_enforcer(budget_mb=DEFAULT_BUDGET_MB, interval=CHECK_INTERVAL, manager=cache_manager):
+    """Check the cache against its budget every ``interval`` seconds on a daemon thread, once per process"""
+    global _enforcer
+
+    def run():
+        while True:
+            try:
+                with span('enforce_cache_budget', page='background'):
+                    manager.enforce_budget(budget_mb * 1024 * 1024)
+            except Exception:
+                # A failed check must not stop the next one, the dashboard keeps running either way
+                _logger.exception("Cache budget check failed")
+            time.sleep(interval)
+
+    with _enforcer_lock:
+        if _enforcer is None and interval:
+            _enforcer = threading.Thread(target=run, name='cache-budget', daemon=True)
+            _enforcer.start()
+        return _enforcer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and maintain the FastF1 and dashboard cache")
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help="FastF1 cache directory, the shared cache "
+                                                              "is located through F1_SHARED_CACHE_DIR")
+    commands = parser.add_subparsers(dest='command', required=True)
+    report = commands.add_parser('report', help="Size per season, event or session")
+    report.add_argument('--by', default='session', choices=['season', 'event', 'session'])
+    report.add_argument('--json', action='store_true')
+    evict = commands.add_parser('evict', help="Evict least recently used sessions to a byte budget")
+    evict.add_argument('--budget-mb', type=float, default=DEFAULT_BUDGET_MB)
+    evict.add_argument('--max-age-days', type=float, help="Also evict sessions unused for this long")
+    evict.add_argument('--min-idle', type=float, default=MIN_IDLE,
+                       help="Seconds a session must have been unused to be evicted")
+    commands.add_parser('compact', help="Drop expired HTTP responses, unreferenced objects and temporary files")
+    verify = commands.add_parser('verify', help="Check every cached file can be read")
+    verify.add_argument('--repair', action='store_true', help="Delete corrupt files so they are rebuilt")
+    args = parser.parse_args()
+
+    manager = CacheManager(cache_dir=args.cache_dir)
+    if args.command == 'report':
+        sizes = manager.report(by=args.by)
+        if args.json:
+            print(json.dumps(sizes, indent=1))
+        else:
+            for label, size in sizes.items():
+                print(f"{size:>10.1f} MB  {label}")
+    elif args.command == 'evict':
+        max_age = args.max_age_days * 86400 if args.max_age_days is not None else None
+        evicted = manager.enforce_budget(args.budget_mb * 1024 * 1024, max_age=max_age, min_idle=args.min_idle)
+        for e in evicted:
+            print(f"evicted {e.session_id} ({e.size / 1024 / 1024:.1f} MB, last used {e.to_dict()['last_used']})")
+        print(f"{len(evicted)} sessions evicted, {manager.total_bytes() / 1024 / 1024:.1f} MB left")
+    elif args.command == 'compact':
+        print(f"{manager.compact() / 1024 / 1024:.1f} MB freed")
+    else:
+        problems = manager.verify(repair=args.repair)
+        for path, problem in problems:
+            print(f"{'removed' if args.repair else 'corrupt'}: {path}: {problem}")
+        print(f"{len(problems)} problems found")
+
+
+if __name__ == "__main__":
+    main()
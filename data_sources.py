@@ -0,0 +1,431 @@
+import argparse
+import json
+import os
+import threading
+
+import fastf1
+import numpy as np
+import pandas as pd
+from fastf1.core import Laps, Session, SessionResults, Telemetry
+from fastf1.events import Event
+
+from utils import SESSION_IDENTIFIERS
+
+# Which provider the dashboard loads sessions from: 'fastf1', 'replay' or 'synthetic'
+DEFAULT_SOURCE = os.environ.get('F1_DATA_SOURCE', 'fastf1')
+
+# Directory of recorded sessions used by the replay provider
+DEFAULT_REPLAY_DIR = os.environ.get('F1_REPLAY_DIR', 'recordings')
+
+_SESSION_COLUMNS = ['Session1', 'Session2', 'Session3', 'Session4', 'Session5']
+
+
+class FastF1Source:
+    """Sessions loaded from the FastF1 backend (and its on-disk cache)"""
+
+    name = 'fastf1'
+
+    def get_event_schedule(self, year):
+        return fastf1.get_event_schedule(year)
+
+    def load_session(self, year, event, session_type, **options):
+        session = fastf1.get_session(year, event, session_type)
+        session.load(**options)
+        return session
+
+    def load_parts(self, session, parts):
+        """Load additional parts into an already loaded session without re-parsing laps"""
+        if 'telemetry' in parts:
+            session._load_telemetry()
+        if 'weather' in parts:
+            session._load_weather_data()
+        if 'messages' in parts:
+            session._load_race_control_messages()
+            session._set_laps_deleted_from_rcm()
+
+
+def build_session(event, session_name, results, laps, car_data, pos_data, t0_date, session_start_time=None):
+    """Assemble a loaded FastF1 Session from plain frames without touching the network
+
+    ``car_data`` and ``pos_data`` are single frames with a DriverNumber column.
+    The result behaves like a session returned by ``Session.load()``, including
+    ``Lap.get_telemetry()``.
+    """
+    session = Session(event, session_name, f1_api_support=True)
+    session._results = SessionResults(results, force_default_cols=True)
+    # Optional columns cannot be forced to a dtype by Laps, so they are set afterwards like FastF1 does
+    session._laps = Laps(laps.drop(columns=['Deleted'], errors='ignore'), session=session, force_default_cols=True)
+    if 'Deleted' in laps:
+        session._laps['Deleted'] = laps['Deleted'].to_numpy()
+    session._t0_date = t0_date
+    session._session_start_time = session_start_time
+    session._total_laps = int(laps['LapNumber'].max()) if session_name in ('Race', 'Sprint') else None
+    session._car_data = {}
+    session._pos_data = {}
+    for frames, target in ((car_data, session._car_data), (pos_data, session._pos_data)):
+        for drv, frame in frames.groupby('DriverNumber', sort=False):
+            frame = frame.drop(columns='DriverNumber').reset_index(drop=True)
+            if 'Date' not in frame:
+                frame['Date'] = t0_date + frame['SessionTime']
+            target[drv] = Telemetry(frame, session=session, driver=drv, drop_unknown_channels=True)
+    return session
+
+
+def _adopt_telemetry(session, loaded):
+    # Move the telemetry of a freshly built copy of a session into the cached session
+    session._car_data, session._pos_data = loaded._car_data, loaded._pos_data
+    for telemetry in list(session._car_data.values()) + list(session._pos_data.values()):
+        telemetry.session = session
+
+
+def _session_name(event, session_type):
+    """Resolve a page session identifier ('R', 'FP1', ...) or name to the event's session name"""
+    names = [event[col] for col in _SESSION_COLUMNS if isinstance(event.get(col), str)]
+    for name in names:
+        if session_type == name or SESSION_IDENTIFIERS.get(name) == session_type:
+            return name
+    raise ValueError(f"Session type '{session_type}' does not exist for this event")
+
+
+def record_session(session, directory):
+    """Write a loaded session to a directory that ReplaySource can load from"""
+    from telemetry_store import session_id
+
+    path = os.path.join(directory, session_id(session))
+    os.makedirs(path, exist_ok=True)
+    pd.DataFrame([session.event]).to_parquet(os.path.join(path, 'event.parquet'))
+    pd.DataFrame(session.results).to_parquet(os.path.join(path, 'results.parquet'))
+    pd.DataFrame(session.laps).to_parquet(os.path.join(path, 'laps.parquet'))
+    for attr, name in (('car_data', 'car_data'), ('pos_data', 'pos_data')):
+        frames = [pd.DataFrame(frame).assign(DriverNumber=drv) for drv, frame in getattr(session, attr).items()]
+        pd.concat(frames, ignore_index=True).to_parquet(os.path.join(path, f"{name}.parquet"))
+    start = getattr(session, '_session_start_time', None)
+    with open(os.path.join(path, 'session.json'), 'w') as f:
+        json.dump({
+            'year': int(session.event.year),
+            'event': session.event['EventName'],
+            'name': session.name,
+            't0_date': session.t0_date.isoformat(),
+            'session_start_time': None if start is None else start.total_seconds(),
+        }, f)
+    return path
+
+
+class ReplaySource:
+    """Sessions replayed from a directory written by ``record_session``"""
+
+    name = 'replay'
+
+    def __init__(self, directory=DEFAULT_REPLAY_DIR):
+        self.directory = directory
+        self._recordings = {}  # (year, event, session name) -> directory
+        self._events = {}  # (year, event) -> Event
+        for entry in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+            meta_path = os.path.join(directory, entry, 'session.json')
+            if not os.path.exists(meta_path):
+                continue
+            with open(meta_path) as f:
+                meta = json.load(f)
+            self._recordings[(meta['year'], meta['event'], meta['name'])] = os.path.join(directory, entry)
+            if (meta['year'], meta['event']) not in self._events:
+                frame = pd.read_parquet(os.path.join(directory, entry, 'event.parquet'))
+                self._events[(meta['year'], meta['event'])] = Event(frame.iloc[0], year=meta['year'])
+
+    def get_event_schedule(self, year):
+        """Recorded events of a season, an empty schedule for seasons without recordings"""
+        events = [event for (event_year, _), event in self._events.items() if event_year == year]
+        if not events:
+            return pd.DataFrame(columns=['RoundNumber', 'EventName', *_SESSION_COLUMNS])
+        return pd.DataFrame(events).sort_values('RoundNumber').reset_index(drop=True)
+
+    def load_session(self, year, event, session_type, **options):
+        event_row = self._events.get((int(year), event))
+        if event_row is None:
+            raise ValueError(f"No recorded sessions for {year} {event}")
+        name = _session_name(event_row, session_type)
+        path = self._recordings.get((int(year), event, name))
+        if path is None:
+            raise ValueError(f"Session '{name}' of {year} {event} has not been recorded")
+
+        with open(os.path.join(path, 'session.json')) as f:
+            meta = json.load(f)
+        start = meta.get('session_start_time')
+        empty = pd.DataFrame({'DriverNumber': pd.Series(dtype=str)})
+        # Recordings always hold everything, so only read the telemetry files when asked for
+        with_telemetry = options.get('telemetry', True)
+        return build_session(
+            event_row, name,
+            results=pd.read_parquet(os.path.join(path, 'results.parquet')),
+            laps=pd.read_parquet(os.path.join(path, 'laps.parquet')),
+            car_data=pd.read_parquet(os.path.join(path, 'car_data.parquet')) if with_telemetry else empty,
+            pos_data=pd.read_parquet(os.path.join(path, 'pos_data.parquet')) if with_telemetry else empty,
+            t0_date=pd.Timestamp(meta['t0_date']),
+            session_start_time=None if start is None else pd.Timedelta(seconds=start),
+        )
+
+    def load_parts(self, session, parts):
+        if 'telemetry' in parts:
+            _adopt_telemetry(session, self.load_session(session.event.year, session.event['EventName'], session.name))
+
+
+# 2024 grid used for synthetic sessions, teammates next to each other
+_SYNTHETIC_GRID = [
+    ('1', 'VER', 'Red Bull Racing'), ('11', 'PER', 'Red Bull Racing'),
+    ('44', 'HAM', 'Mercedes'), ('63', 'RUS', 'Mercedes'),
+    ('16', 'LEC', 'Ferrari'), ('55', 'SAI', 'Ferrari'),
+    ('4', 'NOR', 'McLaren'), ('81', 'PIA', 'McLaren'),
+    ('14', 'ALO', 'Aston Martin'), ('18', 'STR', 'Aston Martin'),
+    ('10', 'GAS', 'Alpine'), ('31', 'OCO', 'Alpine'),
+    ('23', 'ALB', 'Williams'), ('2', 'SAR', 'Williams'),
+    ('77', 'BOT', 'Kick Sauber'), ('24', 'ZHO', 'Kick Sauber'),
+    ('22', 'TSU', 'RB'), ('3', 'RIC', 'RB'),
+    ('20', 'MAG', 'Haas F1 Team'), ('27', 'HUL', 'Haas F1 Team'),
+]
+
+# Upper bounds of each gear in km/h
+_GEAR_SPEEDS = np.array([90, 130, 165, 200, 235, 265, 295, 400])
+
+
+def _synthetic_track(length=5000.0, resolution=1.0):
+    """Closed track outline with a speed profile limited by cornering grip and braking"""
+    theta = np.linspace(0, 2 * np.pi, 4000, endpoint=False)
+    radius = 1 + 0.3 * np.sin(3 * theta) + 0.08 * np.sin(7 * theta + 2) + 0.04 * np.cos(11 * theta + 1)
+    x, y = radius * np.cos(theta), radius * np.sin(theta)
+    segment = np.hypot(np.diff(x, append=x[0]), np.diff(y, append=y[0]))
+    scale = length / segment.sum()
+    s_raw = np.concatenate([[0], np.cumsum(segment)[:-1]]) * scale
+
+    s = np.arange(0, length, resolution)
+    x = np.interp(s, s_raw, x * scale, period=length)
+    y = np.interp(s, s_raw, y * scale, period=length)
+
+    # Corner speed from lateral grip, then acceleration and braking limits around the lap
+    heading = np.unwrap(np.arctan2(np.gradient(y), np.gradient(x)))
+    curvature = np.abs(np.gradient(heading, resolution)) + 1e-6
+    v = np.minimum(np.sqrt(25.0 / curvature), 88.0)
+    for _ in range(2):
+        for i in range(1, len(v)):
+            v[i] = min(v[i], np.sqrt(v[i - 1] ** 2 + 2 * 9.0 * resolution))
+        for i in range(len(v) - 2, -1, -1):
+            v[i] = min(v[i], np.sqrt(v[i + 1] ** 2 + 2 * 40.0 * resolution))
+    elapsed = np.concatenate([[0], np.cumsum(resolution / v)[:-1]])
+    return {'s': s, 'x': x, 'y': y, 'v': v, 'elapsed': elapsed, 'lap_time': elapsed[-1] + resolution / v[-1]}
+
+
+class SyntheticSource:
+    """Deterministic, realistic-looking sessions generated without any network access
+
+    Every session has ``n_drivers`` drivers doing ``n_laps`` laps on a synthetic
+    5 km track, with car data at ``car_hz`` and position data at ``pos_hz``.
+    """
+
+    name = 'synthetic'
+
+    def __init__(self, n_drivers=20, n_laps=70, car_hz=4.0, pos_hz=10.0, seed=0, n_events=6):
+        self.n_drivers = min(n_drivers, len(_SYNTHETIC_GRID))
+        self.n_laps = n_laps
+        self.car_hz = car_hz
+        self.pos_hz = pos_hz
+        self.seed = seed
+        self.n_events = n_events
+        self._track = _synthetic_track()
+
+    def get_event_schedule(self, year):
+        first = pd.Timestamp(f"{year}-03-03")
+        rows = []
+        for round_number in range(1, self.n_events + 1):
+            date = first + pd.Timedelta(weeks=2 * (round_number - 1))
+            row = {'RoundNumber': round_number, 'Country': 'Synthetia', 'Location': f"Track {round_number}",
+                   'OfficialEventName': f"Synthetic Grand Prix {round_number}",
+                   'EventDate': date, 'EventName': f"Synthetic Grand Prix {round_number}",
+                   'EventFormat': 'conventional', 'F1ApiSupport': True}
+            names = ['Practice 1', 'Practice 2', 'Practice 3', 'Qualifying', 'Race']
+            for i, name in enumerate(names, start=1):
+                day = date - pd.Timedelta(days=2 if i <= 2 else 1 if i <= 4 else 0)
+                row[f"Session{i}"] = name
+                row[f"Session{i}Date"] = day + pd.Timedelta(hours=13)
+                row[f"Session{i}DateUtc"] = day + pd.Timedelta(hours=13)
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def load_session(self, year, event, session_type, **options):
+        schedule = self.get_event_schedule(year)
+        matches = schedule[schedule['EventName'] == event]
+        if matches.empty:
+            raise ValueError(f"Unknown synthetic event '{event}'")
+        event_row = Event(matches.iloc[0], year=year)
+        name = _session_name(event_row, session_type)
+        round_number = int(event_row['RoundNumber'])
+        rng = np.random.default_rng([self.seed, year, round_number, _SESSION_COLUMNS.index(
+            [col for col in _SESSION_COLUMNS if event_row[col] == name][0])])
+
+        grid = _SYNTHETIC_GRID[:self.n_drivers]
+        results = pd.DataFrame({
+            'DriverNumber': [num for num, _, _ in grid],
+            'Abbreviation': [abb for _, abb, _ in grid],
+            'BroadcastName': [abb for _, abb, _ in grid],
+            'FullName': [f"Driver {abb.title()}" for _, abb, _ in grid],
+            'LastName': [abb.title() for _, abb, _ in grid],
+            'TeamName': [team for _, _, team in grid],
+        })
+        laps, car_data, pos_data = self._generate(rng, grid, name in ('Race', 'Sprint'),
+                                                  with_telemetry=options.get('telemetry', True))
+        t0_date = pd.Timestamp(event_row.get_session_date(name, utc=True)) - pd.Timedelta(hours=1)
+        laps['LapStartDate'] = t0_date + laps['LapStartTime']
+
+        # Results are ordered by finishing position, like FastF1 results
+        finish = laps.sort_values('LapNumber').groupby('Driver')['Time'].last().sort_values()
+        results = results.set_index('Abbreviation').loc[finish.index].rename_axis('Abbreviation').reset_index()
+        results['Position'] = np.arange(1, len(results) + 1, dtype=float)
+        return build_session(event_row, name, results, laps, car_data, pos_data, t0_date,
+                             session_start_time=pd.Timedelta(hours=1))
+
+    def load_parts(self, session, parts):
+        if 'telemetry' in parts:
+            _adopt_telemetry(session, self.load_session(session.event.year, session.event['EventName'], session.name))
+
+    def _generate(self, rng, grid, race, with_telemetry=True):
+        track = self._track
+        n_drivers, n_laps = len(grid), self.n_laps
+        compounds = np.array(['SOFT', 'MEDIUM', 'HARD'])
+
+        # Lap times: driver pace, fuel burn, tyre wear, pit stops and noise
+        lap_index = np.arange(n_laps)
+        pit_laps = np.sort(rng.integers(15, n_laps - 10, size=(n_drivers, 2)), axis=1)
+        stint = 1 + (lap_index[None, :] > pit_laps[:, :1]).astype(int) + (lap_index[None, :] > pit_laps[:, 1:]).astype(int)
+        stint_start = np.where(stint == 1, 0, np.where(stint == 2, pit_laps[:, :1] + 1, pit_laps[:, 1:] + 1))
+        tyre_life = lap_index[None, :] - stint_start + 1
+        lap_times = (track['lap_time']
+                     + np.linspace(0, 1.5, n_drivers)[:, None]
+                     + (0.6 if race else 0.0) * (1 - lap_index[None, :] / n_laps)
+                     + 0.04 * tyre_life
+                     + rng.normal(0, 0.25, size=(n_drivers, n_laps)))
+        if race:
+            lap_times[:, 0] += 6.0
+            np.put_along_axis(lap_times, pit_laps, np.take_along_axis(lap_times, pit_laps, 1) + 21.0, axis=1)
+        session_start = 3600.0
+        lap_end = session_start + np.cumsum(lap_times, axis=1)
+        lap_start = lap_end - lap_times
+
+        # Positions by order of crossing the line at the end of each lap
+        position = lap_end.argsort(axis=0).argsort(axis=0) + 1.0
+        best = np.minimum.accumulate(lap_times, axis=1)
+
+        sector_split = np.interp([track['s'][-1] / 3, 2 * track['s'][-1] / 3], track['s'], track['elapsed']) / track['lap_time']
+        laps = pd.DataFrame({
+            'Driver': np.repeat([abb for _, abb, _ in grid], n_laps),
+            'DriverNumber': np.repeat([num for num, _, _ in grid], n_laps),
+            'Team': np.repeat([team for _, _, team in grid], n_laps),
+            'LapNumber': np.tile(lap_index + 1, n_drivers).astype(float),
+            'LapTime': pd.to_timedelta(lap_times.ravel(), unit='s'),
+            'Time': pd.to_timedelta(lap_end.ravel(), unit='s'),
+            'LapStartTime': pd.to_timedelta(lap_start.ravel(), unit='s'),
+            'Sector1Time': pd.to_timedelta((lap_times * sector_split[0]).ravel(), unit='s'),
+            'Sector2Time': pd.to_timedelta((lap_times * (sector_split[1] - sector_split[0])).ravel(), unit='s'),
+            'Sector3Time': pd.to_timedelta((lap_times * (1 - sector_split[1])).ravel(), unit='s'),
+            'Stint': stint.ravel().astype(float),
+            'Compound': compounds[(stint.ravel() - 1 + np.repeat(np.arange(n_drivers), n_laps)) % 3],
+            'TyreLife': tyre_life.ravel().astype(float),
+            'FreshTyre': True,
+            'IsPersonalBest': (lap_times == best).ravel(),
+            'Position': position.ravel() if race else np.nan,
+            'TrackStatus': '1',
+            'IsAccurate': True,
+            'FastF1Generated': False,
+            'Deleted': False,
+        })
+        if not with_telemetry:
+            empty = pd.DataFrame({'DriverNumber': pd.Series(dtype=str)})
+            return laps, empty, empty
+
+        # Like the live feed, all cars share one sample clock per data stream, with a little jitter
+        clocks = {}
+        for source, hz in (('car', self.car_hz), ('pos', self.pos_hz)):
+            t = np.arange(session_start - 5.0, lap_end.max() + 5.0, 1 / hz)
+            clocks[source] = t + rng.uniform(0, 0.3 / hz, size=len(t))
+
+        car_frames, pos_frames = [], []
+        for i, (num, _, _) in enumerate(grid):
+            car_frames.append(self._sample(track, clocks['car'], lap_start[i], lap_times[i], 'car').assign(DriverNumber=num))
+            pos_frames.append(self._sample(track, clocks['pos'], lap_start[i], lap_times[i], 'pos').assign(DriverNumber=num))
+        return laps, pd.concat(car_frames, ignore_index=True), pd.concat(pos_frames, ignore_index=True)
+
+    def _sample(self, track, t, lap_start, lap_times, source):
+        # Map each sample time to its lap and to the distance along the track
+        lap = np.clip(np.searchsorted(lap_start, t, side='right') - 1, 0, len(lap_start) - 1)
+        fraction = np.clip((t - lap_start[lap]) / lap_times[lap], 0, 1)
+        distance = np.interp(fraction * track['lap_time'], track['elapsed'], track['s'])
+        scale = track['lap_time'] / lap_times[lap]
+
+        session_time = pd.to_timedelta(t, unit='s')
+        frame = pd.DataFrame({'Time': session_time, 'SessionTime': session_time, 'Source': source})
+        if source == 'pos':
+            frame['X'] = np.interp(distance, track['s'], track['x']) * 10
+            frame['Y'] = np.interp(distance, track['s'], track['y']) * 10
+            frame['Z'] = 100 + 20 * np.sin(2 * np.pi * distance / track['s'][-1])
+            frame['Status'] = 'OnTrack'
+            return frame
+
+        speed = np.interp(distance, track['s'], track['v']) * 3.6 * scale
+        accel = np.interp(distance, track['s'], np.gradient(track['v']))
+        gear = np.searchsorted(_GEAR_SPEEDS, speed) + 1
+        gear_floor = np.concatenate([[0], _GEAR_SPEEDS])[gear - 1]
+        gear_span = _GEAR_SPEEDS[gear - 1] - gear_floor
+        frame['RPM'] = np.round(9500 + 2500 * (speed - gear_floor) / gear_span)
+        frame['Speed'] = np.round(speed)
+        frame['nGear'] = gear
+        frame['Throttle'] = np.where(accel < -0.01, 0, np.where(accel > 0.001, 100, 60)).astype(float)
+        frame['Brake'] = accel < -0.01
+        frame['DRS'] = np.where(speed > 285, 12, 1)
+        return frame
+
+
+_source = None
+_source_lock = threading.Lock()
+
+
+def make_source(name=DEFAULT_SOURCE):
+    if name == 'fastf1':
+        return FastF1Source()
+    if name == 'replay':
+        return ReplaySource()
+    if name == 'synthetic':
+        return SyntheticSource()
+    raise ValueError(f"Unknown data source '{name}'")
+
+
+def get_data_source():
+    """Common function to get the provider every page loads sessions from"""
+    global _source
+    with _source_lock:
+        if _source is None:
+            _source = make_source()
+        return _source
+
+
+def set_data_source(source):
+    """Switch the process-wide provider, e.g. to a synthetic source for benchmarks"""
+    global _source
+    with _source_lock:
+        _source = source
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record sessions from FastF1 so they can be replayed offline")
+    parser.add_argument('year', type=int)
+    parser.add_argument('event')
+    parser.add_argument('sessions', nargs='+', help="Session identifiers, e.g. Q R")
+    parser.add_argument('--out', default=DEFAULT_REPLAY_DIR, help="Recordings directory")
+    args = parser.parse_args()
+
+    os.makedirs('cache', exist_ok=True)
+    fastf1.Cache.enable_cache('cache')
+    source = FastF1Source()
+    for session_type in args.sessions:
+        session = source.load_session(args.year, args.event, session_type,
+                                      laps=True, telemetry=True, weather=False, messages=False)
+        print(f"Recorded {record_session(session, args.out)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import logging
+import os
+from collections import OrderedDict
+
+import numpy as np
+import streamlit as st
+
+from tracing import span
+
+_logger = logging.getLogger(__name__)
+
+# Maximum number of points sent to the browser per trace
+DEFAULT_MAX_POINTS = int(os.environ.get('F1_MAX_POINTS_PER_TRACE', '2000'))
+
+# Traces with at most this many distinct y values (gears, brake, DRS) are step
+# signals and use min/max bucketing, which keeps every transition edge
+_STEP_SIGNAL_MAX_LEVELS = 16
+
+# Number of most recently rendered charts in the payload report of each browser session
+_MAX_REPORTS = 20
+
+# Approximate JSON size of one x or y value, payloads are estimated from point counts
+# instead of serializing every figure to measure it
+_JSON_BYTES_PER_VALUE = 12
+
+
+def lttb_indices(x, y, n_out):
+    """Indexes of the points kept by largest-triangle-three-buckets downsampling"""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    indices = np.empty(n_out, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
+
+    selected = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x = x[edges[i + 1]:edges[i + 2]].mean()
+            next_y = y[edges[i + 1]:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        # Area of the triangle between the last kept point, each candidate and the next bucket's mean
+        areas = np.abs((x[selected] - next_x) * (y[lo:hi] - y[selected])
+                       - (x[selected] - x[lo:hi]) * (next_y - y[selected]))
+        selected = lo + int(np.nanargmax(areas)) if not np.isnan(areas).all() else lo
+        indices[i + 1] = selected
+    return indices
+
+
+def minmax_indices(y, n_out):
+    """Indexes of the minimum and maximum of each bucket, computed for all buckets at once"""
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=float)
+    n_buckets = (n_out - 2) // 2
+    size = int(np.ceil(n / n_buckets))
+    padded = np.full(n_buckets * size, np.nan)
+    padded[:n] = y
+    buckets = padded.reshape(n_buckets, size)
+    offsets = np.arange(n_buckets) * size
+
+    lows = np.argmin(np.where(np.isnan(buckets), np.inf, buckets), axis=1) + offsets
+    highs = np.argmax(np.where(np.isnan(buckets), -np.inf, buckets), axis=1) + offsets
+    indices = np.concatenate([[0, n - 1], lows, highs])
+    return np.unique(np.clip(indices, 0, n - 1))
+
+
+def downsample_indices(x, y, max_points=DEFAULT_MAX_POINTS):
+    """Pick the downsampling method that suits the trace and return the kept indexes"""
+    values = np.asarray(y, dtype=float)
+    if len(np.unique(values[~np.isnan(values)])) <= _STEP_SIGNAL_MAX_LEVELS:
+        return minmax_indices(values, max_points)
+    return lttb_indices(x, values, max_points)
+
+
+def downsample_figure(fig, max_points=DEFAULT_MAX_POINTS):
+    """Cap the number of points of every line trace in a Plotly figure (in place)"""
+    for trace in fig.data:
+        if trace.type not in ('scatter', 'scattergl') or trace.x is None or trace.y is None:
+            continue
+        if len(trace.y) <= max_points:
+            continue
+        keep = downsample_indices(np.asarray(trace.x, dtype=float), trace.y, max_points)
+        # Per-point arrays all have to be reduced the same way
+        for attr in ('x', 'y', 'text', 'customdata', 'hovertext'):
+            values = getattr(trace, attr)
+            if values is not None and not isinstance(values, str) and len(values) == len(trace.y):
+                setattr(trace, attr, np.asarray(values)[keep])
+    return fig
+
+
+def figure_points(fig):
+    """Number of points of the line traces of a figure"""
+    return sum(len(trace.y) for trace in fig.data
+               if trace.type in ('scatter', 'scattergl') and trace.y is not None)
+
+
+def chart_reports():
+    """Payload report of the charts most recently rendered for this browser session"""
+    return st.session_state.setdefault('chart_reports', OrderedDict())
+
+
+def record_chart(fig, original_points, sent_points):
+    """Add a chart's estimated payload and the bytes downsampling saved to this session's report"""
+    reports = chart_reports()
+    title = fig.layout.title.text or f"Chart {len(reports) + 1}"
+    original_bytes = original_points * 2 * _JSON_BYTES_PER_VALUE
+    sent_bytes = sent_points * 2 * _JSON_BYTES_PER_VALUE
+    reports[title] = {
+        'original_points': original_points,
+        'sent_points': sent_points,
+        'original_kb': round(original_bytes / 1024, 1),
+        'sent_kb': round(sent_bytes / 1024, 1),
+        'saved_kb': round((original_bytes - sent_bytes) / 1024, 1),
+    }
+    reports.move_to_end(title)
+    while len(reports) > _MAX_REPORTS:
+        reports.popitem(last=False)
+    _logger.info("%s: about %d bytes sent, %d bytes saved", title, sent_bytes, original_bytes - sent_bytes)
+
+
+def show_plotly_chart(fig, max_points=DEFAULT_MAX_POINTS, **kwargs):
+    """Common function to downsample a figure, display it and record the bytes saved"""
+    with span('downsample'):
+        original_points = figure_points(fig)
+        downsample_figure(fig, max_points=max_points)
+    record_chart(fig, original_points, figure_points(fig))
+
+    with span('plotly_chart'):
+        st.plotly_chart(fig, **kwargs)
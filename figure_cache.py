@@ -0,0 +1,133 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import streamlit as st
+from plotly.subplots import make_subplots
+
+from downsampling import DEFAULT_MAX_POINTS, downsample_indices, figure_points, record_chart
+from tracing import span
+
+# Downsampled traces and assembled figures kept in memory, least recently used dropped first
+MAX_TRACES = 512
+MAX_FIGURES = 64
+
+
+def content_hash(*parts):
+    """Digest of arrays and JSON-able values, equal for equal contents whatever object holds them"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if isinstance(part, np.ndarray) or hasattr(part, 'to_numpy'):
+            values = np.ascontiguousarray(np.asarray(part))
+            digest.update(f"{values.dtype.str}{values.shape}".encode())
+            digest.update(values.tobytes())
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+class FigureCache:
+    """Process-wide cache of downsampled Plotly traces and the subplot figures built from them
+
+    Traces are keyed by the hash of their data and style, figures by the keys
+    of their traces and their layout. A rerun that shows the same data gets the
+    same figure object back, so it is neither downsampled nor rebuilt, and it
+    serializes to the same bytes. Streamlit sends identical chart messages to a
+    browser that already has them as a short reference only.
+    """
+
+    def __init__(self, max_traces=MAX_TRACES, max_figures=MAX_FIGURES):
+        self.max_traces = max_traces
+        self.max_figures = max_figures
+        self._traces = OrderedDict()  # key -> trace properties
+        self._figures = OrderedDict()  # key -> go.Figure
+        self._lock = threading.Lock()
+        self.trace_hits = 0
+        self.trace_misses = 0
+        self.figure_hits = 0
+        self.figure_misses = 0
+
+    def _get(self, entries, key):
+        with self._lock:
+            value = entries.get(key)
+            if value is not None:
+                entries.move_to_end(key)
+            return value
+
+    def _put(self, entries, key, value, max_entries):
+        with self._lock:
+            entries[key] = value
+            entries.move_to_end(key)
+            while len(entries) > max_entries:
+                entries.popitem(last=False)
+
+    def trace(self, x, y, max_points=DEFAULT_MAX_POINTS, **style):
+        """Key and downsampled properties of a line trace"""
+        key = content_hash(x, y, max_points, style)
+        trace = self._get(self._traces, key)
+        if trace is None:
+            self.trace_misses += 1
+            x = np.asarray(x, dtype=float)
+            y = np.asarray(y, dtype=float)
+            keep = downsample_indices(x, y, max_points) if len(y) > max_points else slice(None)
+            trace = {'type': 'scatter', 'mode': 'lines', 'x': x[keep], 'y': y[keep], **style}
+            self._put(self._traces, key, trace, self.max_traces)
+        else:
+            self.trace_hits += 1
+        return key, trace
+
+    def subplots(self, rows, traces, layout, max_points=DEFAULT_MAX_POINTS):
+        """One figure with a row per y axis title in ``rows``, all rows sharing the x axis
+
+        ``traces`` holds (row index, x, y, style) tuples. The returned figure is
+        shared between reruns and sessions and must not be modified.
+        """
+        keyed = [(row, *self.trace(x, y, max_points, **style)) for row, x, y, style in traces]
+        key = content_hash(rows, [(row, trace_key) for row, trace_key, _ in keyed], layout)
+        fig = self._get(self._figures, key)
+        if fig is not None:
+            self.figure_hits += 1
+            return fig
+
+        self.figure_misses += 1
+        with span('build_figure'):
+            fig = make_subplots(rows=len(rows), cols=1, shared_xaxes=True, vertical_spacing=0.04)
+            for row, _, trace in keyed:
+                fig.add_trace(trace, row=row + 1, col=1)
+            for row, title in enumerate(rows):
+                fig.update_yaxes(title_text=title, row=row + 1, col=1)
+            # A fixed uirevision keeps the browser's zoom and legend state when the data changes
+            fig.update_layout(height=250 * len(rows) + 100, uirevision=layout.get('title', ''), **layout)
+        self._put(self._figures, key, fig, self.max_figures)
+        return fig
+
+    def clear(self):
+        with self._lock:
+            self._traces.clear()
+            self._figures.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'traces': len(self._traces),
+                'figures': len(self._figures),
+                'trace_hits': self.trace_hits,
+                'trace_misses': self.trace_misses,
+                'figure_hits': self.figure_hits,
+                'figure_misses': self.figure_misses,
+            }
+
+
+# Module level instance shared by every page
+figure_cache = FigureCache()
+
+
+def show_subplots(rows, traces, layout, max_points=DEFAULT_MAX_POINTS, **kwargs):
+    """Common function to display a cached subplot figure, see FigureCache.subplots"""
+    fig = figure_cache.subplots(rows, traces, layout, max_points=max_points)
+    record_chart(fig, sum(len(y) for _, _, y, _ in traces), figure_points(fig))
+    with span('plotly_chart'):
+        st.plotly_chart(fig, **kwargs)
+    return fig
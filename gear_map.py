@@ -0,0 +1,128 @@
+import threading
+from collections import OrderedDict
+
+import matplotlib.pyplot as plt
+import numpy as np
+import plotly.graph_objects as go
+from matplotlib.colors import to_hex
+
+from telemetry_store import get_lap_telemetry, session_key
+
+# One color per gear 1-8, sampled from the colormap of the matplotlib map
+GEAR_COLORS = [to_hex(color) for color in plt.get_cmap('RdYlBu_r')(np.linspace(0, 1, 8))]
+
+# Number of gear maps kept in memory, least recently used ones are dropped first
+MAX_GEAR_MAPS = 128
+
+
+def create_gear_map_figure(telemetry, title):
+    """Matplotlib track map of a lap with every telemetry point colored by gear"""
+    fig, ax = plt.subplots(figsize=(12, 8))
+    
+    # Create colormap for gears
+    cmap = plt.get_cmap('RdYlBu_r')
+    
+    # Plot the circuit with color-coded gears
+    points = ax.scatter(telemetry['X'], telemetry['Y'],
+                      c=telemetry['nGear'], 
+                      cmap=cmap,
+                      s=30,
+                      vmin=1,
+                      vmax=8)
+    
+    # Add colorbar
+    cbar = fig.colorbar(points, ax=ax)
+    cbar.set_label('Gear')
+    
+    # Set title and labels
+    ax.set_title(title)
+    ax.set_xlabel("X Position (m)")
+    ax.set_ylabel("Y Position (m)")
+    
+    # Set aspect ratio to equal for true track shape
+    ax.set_aspect('equal')
+    return fig
+
+
+def gear_segments(telemetry):
+    """Split a lap into polylines of consecutive points driven in the same gear
+
+    Returns a list of (gear, x, y). Each segment ends on the first point of the
+    next one so the polylines join up into the full track.
+    """
+    frame = telemetry[['X', 'Y', 'nGear']].dropna()
+    x = frame['X'].to_numpy(dtype=float)
+    y = frame['Y'].to_numpy(dtype=float)
+    gears = frame['nGear'].to_numpy(dtype=int)
+    if len(gears) == 0:
+        return []
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(gears)) + 1])
+    ends = np.concatenate([starts[1:] + 1, [len(gears)]])
+    return [(int(gears[start]), x[start:end], y[start:end]) for start, end in zip(starts, ends)]
+
+
+def create_gear_map_plotly(segments, title):
+    """Plotly track map drawing the gear segments as one WebGL line trace per gear"""
+    fig = go.Figure()
+    for gear in sorted({gear for gear, _, _ in segments}):
+        # Segments of the same gear share a trace, NaN breaks the line between them
+        parts = [(sx, sy) for g, sx, sy in segments if g == gear]
+        x = np.concatenate([np.append(sx, np.nan) for sx, _ in parts])
+        y = np.concatenate([np.append(sy, np.nan) for _, sy in parts])
+        fig.add_trace(go.Scattergl(
+            x=x, y=y,
+            mode='lines',
+            name=f"Gear {gear}",
+            line=dict(color=GEAR_COLORS[min(max(gear, 1), 8) - 1], width=5),
+            hovertemplate=f"Gear {gear}<extra></extra>",
+            connectgaps=False,
+        ))
+    fig.update_layout(
+        title=title,
+        xaxis=dict(title="X Position (m)", showgrid=False, zeroline=False),
+        # Equal axis scales for the true track shape
+        yaxis=dict(title="Y Position (m)", showgrid=False, zeroline=False, scaleanchor='x', scaleratio=1),
+        legend=dict(title="Gear"),
+        height=700,
+    )
+    return fig
+
+
+class GearMap:
+    """Gear segments and figure of one lap, with the DRS sample count shown next to it"""
+
+    def __init__(self, segments, figure, drs_samples):
+        self.segments = segments
+        self.figure = figure
+        self.drs_samples = drs_samples
+
+    @classmethod
+    def from_telemetry(cls, telemetry, title):
+        segments = gear_segments(telemetry)
+        drs_samples = int((telemetry['DRS'] > 0).sum()) if 'DRS' in telemetry else None
+        return cls(segments, create_gear_map_plotly(segments, title), drs_samples)
+
+
+_gear_maps = OrderedDict()
+_gear_maps_lock = threading.Lock()
+
+
+def get_gear_map(session, lap, title):
+    """Common function to get a lap's gear map, building it only once per session, driver and lap"""
+    key = (*session_key(session), lap['Driver'], int(lap['LapNumber']))
+    with _gear_maps_lock:
+        gear_map = _gear_maps.get(key)
+        if gear_map is not None:
+            _gear_maps.move_to_end(key)
+            return gear_map
+
+    telemetry = get_lap_telemetry(session, lap)
+    if telemetry is None or len(telemetry) == 0:
+        raise ValueError("No telemetry data available for this lap")
+    gear_map = GearMap.from_telemetry(telemetry, title)
+
+    with _gear_maps_lock:
+        _gear_maps[key] = gear_map
+        while len(_gear_maps) > MAX_GEAR_MAPS:
+            _gear_maps.popitem(last=False)
+    return gear_map
@@ -0,0 +1,111 @@
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import pyarrow as pa
+
+from shared_cache import shared_cache
+from telemetry_store import session_key
+
+# Grouping levels of the aggregates
+STATS_LEVELS = {
+    'driver': ['Driver'],
+    'stint': ['Driver', 'Stint'],
+    'compound': ['Driver', 'Compound'],
+}
+
+_LAP_COLUMNS = ['Driver', 'Team', 'LapNumber', 'Stint', 'Compound', 'LapTime']
+
+# Number of sessions whose stats are kept in memory, least recently used ones are dropped first
+MAX_STATS = 16
+
+
+def aggregate_lap_times(laps, by):
+    """Mean, median, quartiles, min, max, count and stddev of 'LapTime(s)' per group"""
+    grouped = laps.groupby(by, observed=True, dropna=True)['LapTime(s)']
+    stats = grouped.agg(['mean', 'median', 'min', 'max', 'count', 'std'])
+    quantiles = grouped.quantile([0.25, 0.75]).unstack()
+    stats['q25'] = quantiles[0.25]
+    stats['q75'] = quantiles[0.75]
+    return stats.reset_index()
+
+
+class LapStats:
+    """Lap time aggregates of one session, all times in float seconds"""
+
+    def __init__(self, quicklaps, aggregates):
+        self.quicklaps = quicklaps
+        self.aggregates = aggregates
+
+    @property
+    def by_driver(self):
+        return self.aggregates['driver']
+
+    @property
+    def by_stint(self):
+        return self.aggregates['stint']
+
+    @property
+    def by_compound(self):
+        return self.aggregates['compound']
+
+    @classmethod
+    def from_session(cls, session):
+        source = session.laps
+        laps = pd.DataFrame(source[[col for col in _LAP_COLUMNS if col in source.columns]])
+        # Convert timedeltas to seconds once for every aggregate
+        laps['LapTime(s)'] = laps['LapTime'].dt.total_seconds()
+        laps = laps.drop(columns='LapTime')
+
+        aggregates = {level: aggregate_lap_times(laps, by) for level, by in STATS_LEVELS.items()}
+
+        # Quick laps are judged against the fastest lap of the whole session
+        quick_mask = source.pick_quicklaps().index
+        quicklaps = laps.loc[quick_mask].reset_index(drop=True)
+        return cls(quicklaps, aggregates)
+
+    def save(self, cache, key):
+        """Store every table in the shared cache under (lap_stats, *key, table name)"""
+        tables = {'quicklaps': self.quicklaps, **self.aggregates}
+        for name, table in tables.items():
+            cache.put(('lap_stats', *key, name), pa.Table.from_pandas(table, preserve_index=False))
+
+    @classmethod
+    def read(cls, cache, key):
+        """Stats stored by ``save``, None unless every table is in the cache"""
+        tables = {name: cache.get(('lap_stats', *key, name)) for name in ['quicklaps', *STATS_LEVELS]}
+        if any(table is None for table in tables.values()):
+            return None
+        quicklaps = tables.pop('quicklaps').to_pandas()
+        return cls(quicklaps, {level: table.to_pandas() for level, table in tables.items()})
+
+
+_stats = OrderedDict()
+_stats_lock = threading.Lock()
+
+
+def get_lap_stats(session, cache=shared_cache):
+    """Common function to get the lap time aggregates of a session, computing them only once
+
+    The aggregates are shared with other processes through the shared cache,
+    only one of them computes the stats of a session.
+    """
+    key = session_key(session)
+    with _stats_lock:
+        if key in _stats:
+            _stats.move_to_end(key)
+            return _stats[key]
+
+    stats = LapStats.read(cache, key)
+    if stats is None:
+        with cache.lock(('lap_stats', *key)):
+            stats = LapStats.read(cache, key)
+            if stats is None:
+                stats = LapStats.from_session(session)
+                stats.save(cache, key)
+
+    with _stats_lock:
+        _stats[key] = stats
+        while len(_stats) > MAX_STATS:
+            _stats.popitem(last=False)
+    return stats
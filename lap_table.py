@@ -0,0 +1,176 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from shared_cache import arrays_to_table, shared_cache, table_to_arrays
+from telemetry_store import session_key
+
+# FastF1 lap columns kept as float32 seconds, NaN where missing
+TIME_COLUMNS = ['LapTime', 'Sector1Time', 'Sector2Time', 'Sector3Time',
+                'LapStartTime', 'Time', 'PitInTime', 'PitOutTime']
+
+# Integer columns kept as int16, -1 where missing
+INT_COLUMNS = ['LapNumber', 'Position', 'Stint', 'TyreLife']
+
+BOOL_COLUMNS = ['IsPersonalBest', 'FreshTyre', 'IsAccurate']
+
+# Text columns stored as int16 codes into a per-table list of categories
+CATEGORY_COLUMNS = ['Driver', 'Team', 'Compound']
+
+# Speed trap columns of the session's own laps frame that float32 holds exactly enough
+SPEED_TRAP_COLUMNS = ['SpeedI1', 'SpeedI2', 'SpeedFL', 'SpeedST']
+
+
+class LapTable:
+    """Compact, read-only copy of a session's laps
+
+    Rows are sorted by driver and lap number, so the laps of a driver are the
+    contiguous rows ``offsets[i]:offsets[i + 1]`` of every column array.
+    ``source_rows`` maps each row back to its position in ``session.laps``.
+
+    Lap lookups are indexed once on construction: (driver, lap number) to row,
+    each driver's sorted lap numbers and fastest lap.
+    """
+
+    def __init__(self, categories, columns, offsets, source_rows):
+        self.categories = categories
+        self.columns = columns
+        self.offsets = offsets
+        self.source_rows = source_rows
+        self.drivers = categories['Driver']
+        self._driver_index = {drv: i for i, drv in enumerate(self.drivers)}
+        self._build_index()
+
+    def _build_index(self):
+        lap_numbers = self.columns['LapNumber']
+        lap_times = self.columns['LapTime']
+        personal_best = self.columns['IsPersonalBest']
+        self._rows = {}  # (driver, lap number) -> row, the first row wins for duplicated lap numbers
+        self._lap_numbers = {}
+        self._fastest_rows = {}
+        for i, drv in enumerate(self.drivers):
+            start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+            numbers = lap_numbers[start:end].tolist()
+            for row, number in zip(range(end - 1, start - 1, -1), reversed(numbers)):
+                self._rows[(drv, number)] = row
+            self._lap_numbers[drv] = sorted(set(numbers))
+
+            # Same rule as Laps.pick_fastest: quickest of the laps marked as personal best
+            best = np.flatnonzero(personal_best[start:end] & ~np.isnan(lap_times[start:end])) + start
+            self._fastest_rows[drv] = int(best[np.argmin(lap_times[best])]) if len(best) else None
+
+    @classmethod
+    def from_laps(cls, laps):
+        frame = pd.DataFrame(laps).reset_index(drop=True)
+        frame['_source_row'] = np.arange(len(frame))
+        frame = frame.dropna(subset=['Driver', 'LapNumber'])
+        frame = frame.sort_values(['Driver', 'LapNumber'], kind='stable')
+
+        columns = {}
+        categories = {}
+        for name in CATEGORY_COLUMNS:
+            values = pd.Categorical(frame[name]) if name in frame else pd.Categorical([None] * len(frame))
+            categories[name] = [str(category) for category in values.categories]
+            columns[name] = values.codes.astype(np.int16)
+        for name in TIME_COLUMNS:
+            values = frame[name].dt.total_seconds() if name in frame else np.nan
+            columns[name] = np.ascontiguousarray(np.broadcast_to(values, len(frame)), dtype=np.float32)
+        for name in INT_COLUMNS:
+            values = frame[name].fillna(-1) if name in frame else -1
+            columns[name] = np.ascontiguousarray(np.broadcast_to(values, len(frame)), dtype=np.int16)
+        for name in BOOL_COLUMNS:
+            values = frame[name].fillna(False).astype(bool) if name in frame else False
+            columns[name] = np.ascontiguousarray(np.broadcast_to(values, len(frame)), dtype=bool)
+
+        # Driver codes are sorted, so each driver's first row is found with one search
+        offsets = np.searchsorted(columns['Driver'], np.arange(len(categories['Driver']) + 1)).astype(np.int32)
+        for values in columns.values():
+            values.flags.writeable = False
+        return cls(categories, columns, offsets,
+                   source_rows=frame['_source_row'].to_numpy(dtype=np.int32))
+
+    def to_arrow(self):
+        """Arrow table of every array, the category lists kept in the schema metadata"""
+        table = arrays_to_table({**self.columns, '_offsets': self.offsets, '_source_rows': self.source_rows})
+        return table.replace_schema_metadata({**table.schema.metadata,
+                                              b'categories': json.dumps(self.categories).encode()})
+
+    @classmethod
+    def from_arrow(cls, table):
+        arrays = table_to_arrays(table)
+        offsets = arrays.pop('_offsets')
+        source_rows = arrays.pop('_source_rows')
+        for values in arrays.values():
+            values.flags.writeable = False
+        return cls(json.loads(table.schema.metadata[b'categories']), arrays, offsets, source_rows)
+
+    @property
+    def nbytes(self):
+        return sum(values.nbytes for values in self.columns.values()) + self.offsets.nbytes + self.source_rows.nbytes
+
+    def __len__(self):
+        return len(self.source_rows)
+
+    def driver_rows(self, driver):
+        """Row slice of a driver's laps, empty for drivers without laps"""
+        i = self._driver_index.get(driver)
+        if i is None:
+            return slice(0, 0)
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def column(self, name, driver=None):
+        values = self.columns[name]
+        return values if driver is None else values[self.driver_rows(driver)]
+
+    def lap_numbers(self, driver):
+        """Sorted lap numbers of a driver"""
+        return self._lap_numbers.get(driver, [])
+
+    def row(self, driver, lap_number):
+        return self._rows.get((driver, int(lap_number)))
+
+    def fastest_row(self, driver):
+        return self._fastest_rows.get(driver)
+
+    def source_lap(self, session, row):
+        """The FastF1 Lap of a row, None for a missing row"""
+        return None if row is None else session.laps.iloc[int(self.source_rows[row])]
+
+    def lap(self, session, driver, lap_number):
+        return self.source_lap(session, self.row(driver, lap_number))
+
+    def fastest_lap(self, session, driver):
+        return self.source_lap(session, self.fastest_row(driver))
+
+
+def get_lap_table(session, cache=shared_cache):
+    """Common function to get a session's compact lap table, building it only once
+
+    The table is memory-mapped from the shared cache, so every process on the
+    host builds it at most once and reads the same pages. It is kept on the
+    session, so it lives and is evicted together with its session.
+    """
+    table = vars(session).get('_lap_table')
+    if table is None:
+        table = LapTable.from_arrow(cache.get_or_build(('lap_table', *session_key(session)),
+                                                       lambda: LapTable.from_laps(session.laps).to_arrow()))
+        session._lap_table = table
+    return table
+
+
+def slim_laps(session):
+    """Shrink a session's laps frame in place: text columns as categories, speed traps as float32
+
+    Values, row order and index stay as they are, so FastF1 and every
+    ``source_rows`` position keep working on the frame.
+    """
+    laps = vars(session).get('_laps')
+    if laps is None:
+        return
+    for name in CATEGORY_COLUMNS:
+        if name in laps and laps[name].dtype == object:
+            laps[name] = laps[name].astype('category')
+    for name in SPEED_TRAP_COLUMNS:
+        if name in laps and laps[name].dtype == np.float64:
+            laps[name] = laps[name].astype(np.float32)
@@ -1,8 +1,34 @@
+import numpy as np
 import streamlit as st
-import fastf1
+import plotly.colors
 import plotly.graph_objects as go
-import numpy as np
-from utils import get_year_selection, format_time
+from utils import get_year_selection, format_time, SESSION_IDENTIFIERS
+from session_cache import load_session
+from prefetch import prefetch_related
+from figure_cache import show_subplots
+from telemetry_store import get_laps_telemetry, has_lap_telemetry
+from lap_table import get_lap_table
+from resampling import resample_laps, DEFAULT_RESOLUTION, RESAMPLE_CHANNELS
+from schedule_index import get_event_names
+from tracing import PageProgress, span
+
+# Parts of the session this page uses, see session_cache.LOAD_PROFILES. Lap telemetry comes
+# from the telemetry store or caches, car and position data are loaded only for laps missing there
+LOAD_PROFILE = 'laps'
+TELEMETRY_PROFILE = 'telemetry'
+
+# Traced stages, the progress bar advances by their measured duration
+STAGES = ['schedule', 'load', 'filter', 'telemetry', 'resample', 'figure']
+
+# Most laps compared at once, one color of the palette each
+MAX_DRIVERS = 10
+COLORS = plotly.colors.qualitative.Plotly
+
+# Lap selectors per row below the driver selection
+LAP_COLUMNS = 5
+
+# Default number of equally long mini-sectors the lap is split into
+DEFAULT_MINI_SECTORS = 25
 
 def show_comparison_page():
     st.title("Driver Comparison Analysis")
@@ -12,181 +38,153 @@ def show_comparison_page():
     
     try:
         # Create progress indicators
-        progress_bar = st.progress(0)
-        status_text = st.empty()
+        progress = PageProgress('comparison', STAGES)
         
-        status_text.text("Loading race calendar...")
-        progress_bar.progress(10)
+        progress.stage('schedule', "Loading race calendar...")
         
         # Load race schedule for selected year
-        schedule = fastf1.get_event_schedule(year)
-        race_names = schedule['EventName'].tolist()
+        race_names = get_event_names(year)
         selected_race = st.sidebar.selectbox("Select Race", race_names, key='comparison_race')
         
         # Session selection
-        session_types = {
-            'Practice 1': 'FP1',
-            'Practice 2': 'FP2',
-            'Practice 3': 'FP3',
-            'Qualifying': 'Q',
-            'Sprint Shootout': 'SQ',
-            'Sprint': 'S',
-            'Race': 'R'
-        }
-        selected_session = st.sidebar.selectbox("Select Session", list(session_types.keys()), key='comparison_session')
-        
-        status_text.text("Loading session data...")
-        progress_bar.progress(20)
+        selected_session = st.sidebar.selectbox("Select Session", list(SESSION_IDENTIFIERS), key='comparison_session')
+        
+        progress.set_session(year, selected_race, SESSION_IDENTIFIERS[selected_session])
+        progress.stage('load', "Loading session data...")
         
         # Load session data
-        session = fastf1.get_session(year, selected_race, session_types[selected_session])
-        session.load()
+        session = load_session(year, selected_race, SESSION_IDENTIFIERS[selected_session], profile=LOAD_PROFILE)
+        
+        # Warm up the rest of the weekend and the adjacent rounds in the background
+        prefetch_related(year, selected_race, SESSION_IDENTIFIERS[selected_session])
+        
+        # Compact lap table with per-driver row offsets, built once per session
+        lap_table = get_lap_table(session)
         
-        progress_bar.progress(40)
-        status_text.text("Processing driver data...")
+        progress.stage('filter', "Processing driver data...")
         
         # Get all drivers
         drivers = session.drivers
         driver_info = {session.get_driver(driver)['Abbreviation']: session.get_driver(driver)['FullName'] 
                       for driver in drivers}
         
-        # Create two columns for driver selection
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            st.subheader("Driver 1")
-            driver1 = st.selectbox("Select First Driver", 
-                                 list(driver_info.keys()),
-                                 format_func=lambda x: f"{x} - {driver_info[x]}",
-                                 key='driver1')
-            
-            status_text.text(f"Loading {driver1}'s telemetry...")
-            progress_bar.progress(50)
-            
-            # Get driver 1's laps
-            driver1_laps = session.laps.pick_driver(driver1)
-            driver1_fastest = driver1_laps.pick_fastest()
-            
-            # Convert lap numbers using numpy floor
-            lap_numbers1 = driver1_laps['LapNumber'].unique()
-            lap_numbers1 = sorted([int(np.floor(x)) for x in lap_numbers1])
-            lap_options1 = ["Fastest Lap"] + [f"Lap {lap}" for lap in lap_numbers1]
-            selected_lap1 = st.selectbox("Select Lap", lap_options1, key='lap1')
-        
-        with col2:
-            st.subheader("Driver 2")
-            driver2 = st.selectbox("Select Second Driver", 
-                                 [d for d in list(driver_info.keys()) if d != driver1],
-                                 format_func=lambda x: f"{x} - {driver_info[x]}",
-                                 key='driver2')
-            
-            status_text.text(f"Loading {driver2}'s telemetry...")
-            progress_bar.progress(60)
-            
-            # Get driver 2's laps
-            driver2_laps = session.laps.pick_driver(driver2)
-            driver2_fastest = driver2_laps.pick_fastest()
-            
-            # Convert lap numbers using numpy floor
-            lap_numbers2 = driver2_laps['LapNumber'].unique()
-            lap_numbers2 = sorted([int(np.floor(x)) for x in lap_numbers2])
-            lap_options2 = ["Fastest Lap"] + [f"Lap {lap}" for lap in lap_numbers2]
-            selected_lap2 = st.selectbox("Select Lap", lap_options2, key='lap2')
-        
-        status_text.text("Processing telemetry data...")
-        progress_bar.progress(70)
-        
-        # Get telemetry data for both drivers
-        if selected_lap1 == "Fastest Lap":
-            telemetry1 = driver1_fastest.get_telemetry().copy()
-            lap_time1 = driver1_fastest['LapTime'].total_seconds()
-        else:
-            lap_number1 = int(selected_lap1.split()[1])
-            # Find the matching lap using numpy floor
-            matching_laps1 = driver1_laps[driver1_laps['LapNumber'].apply(lambda x: int(np.floor(x))) == lap_number1]
-            if not matching_laps1.empty:
-                lap_data1 = matching_laps1.iloc[0]
-                telemetry1 = lap_data1.get_telemetry().copy()
-                lap_time1 = lap_data1['LapTime'].total_seconds()
+        # Any number of drivers, each with their own lap
+        driver_codes = list(driver_info.keys())
+        selected_drivers = st.multiselect("Select Drivers",
+                                          driver_codes,
+                                          default=driver_codes[:2],
+                                          format_func=lambda x: f"{x} - {driver_info[x]}",
+                                          max_selections=MAX_DRIVERS,
+                                          key='comparison_drivers')
+        if len(selected_drivers) < 2:
+            st.info("Select at least two drivers to compare.")
+            progress.done()
+            return
+        
+        selected_laps = {}
+        columns = st.columns(min(len(selected_drivers), LAP_COLUMNS))
+        for i, driver in enumerate(selected_drivers):
+            with columns[i % len(columns)]:
+                # Sorted lap numbers come precomputed from the lap index
+                lap_options = ["Fastest Lap"] + [f"Lap {lap}" for lap in lap_table.lap_numbers(driver)]
+                selected_laps[driver] = st.selectbox(f"{driver} Lap", lap_options, key=f'comparison_lap_{driver}')
+        
+        reference = st.selectbox("Reference Driver", selected_drivers, key='comparison_reference')
+        
+        progress.stage('telemetry', "Processing telemetry data...")
+        
+        # Look every lap up in the lap index, then fetch their telemetry in one batch
+        laps = []
+        for driver in selected_drivers:
+            if selected_laps[driver] == "Fastest Lap":
+                lap = lap_table.fastest_lap(session, driver)
+                if lap is None:
+                    raise ValueError(f"No valid fastest lap found for {driver}")
             else:
-                raise ValueError(f"Lap {lap_number1} not found for {driver1}")
-        
-        if selected_lap2 == "Fastest Lap":
-            telemetry2 = driver2_fastest.get_telemetry().copy()
-            lap_time2 = driver2_fastest['LapTime'].total_seconds()
+                lap_number = int(selected_laps[driver].split()[1])
+                lap = lap_table.lap(session, driver, lap_number)
+                if lap is None:
+                    raise ValueError(f"Lap {lap_number} not found for {driver}")
+            laps.append(lap)
+        # Laps missing from the telemetry store and caches are merged by FastF1 from car and position data
+        if not has_lap_telemetry(session, laps):
+            session = load_session(year, selected_race, SESSION_IDENTIFIERS[selected_session], profile=TELEMETRY_PROFILE)
+            laps = [session.laps.loc[lap.name] for lap in laps]
+        telemetries = get_laps_telemetry(session, laps)
+        lap_times = [lap['LapTime'].total_seconds() for lap in laps]
+        
+        progress.stage('resample', "Preparing visualization...")
+        
+        # Align all laps on a common distance grid so they can be compared point by point
+        resolution = st.sidebar.select_slider("Distance Resolution (m)", [1, 2, 5, 10, 20],
+                                              value=DEFAULT_RESOLUTION, key='comparison_resolution')
+        n_sectors = st.sidebar.slider("Mini-Sectors", 5, 50, DEFAULT_MINI_SECTORS, key='comparison_mini_sectors')
+        ref = selected_drivers.index(reference)
+        aligned = resample_laps(telemetries, resolution=resolution,
+                                channels=RESAMPLE_CHANNELS + ['X', 'Y'], reference=ref)
+        winners = aligned.mini_sector_winners(n_sectors)
+        colors = {driver: COLORS[i % len(COLORS)] for i, driver in enumerate(selected_drivers)}
+        
+        # Display lap times with the delta to the reference lap
+        st.markdown("#### Lap Times:\n" + "\n".join(
+            f"- **{driver}**: {format_time(lap_time)}"
+            + ("" if driver == reference else
+               f" ({'+' if lap_time >= lap_times[ref] else '-'}{format_time(abs(lap_time - lap_times[ref]))})")
+            for driver, lap_time in zip(selected_drivers, lap_times)))
+        
+        progress.stage('figure', "Generating plots...")
+        
+        # Speed, throttle, brake and the cumulative time delta to the reference lap share one
+        # figure and its distance axis. Traces are cached by content, so changing one driver's
+        # lap only rebuilds that driver's traces and an unchanged figure is not re-sent
+        channels = [('Speed', 'Speed (km/h)'), ('Throttle', 'Throttle %'), ('Brake', 'Brake %')]
+        traces = []
+        for i, driver in enumerate(selected_drivers):
+            style = {'name': driver, 'legendgroup': driver, 'line': {'color': colors[driver]}}
+            for row, (channel, _) in enumerate(channels):
+                traces.append((row, aligned.distance_km, aligned.channels[channel][i],
+                               {**style, 'showlegend': row == 0}))
+            traces.append((len(channels), aligned.distance_km, aligned.delta[i], {**style, 'showlegend': False}))
+        show_subplots([label for _, label in channels] + [f'Delta to {reference} (s)'], traces,
+                      {'title': 'Telemetry Comparison',
+                       'xaxis4': {'title': 'Distance (km)'},
+                       'hovermode': 'x unified'})
+        
+        # Mini-sectors drawn along the reference lap, colored by the quickest driver. Resampling
+        # drops channels missing from any lap, so there is no map without position data for every lap
+        if 'X' not in aligned.channels or 'Y' not in aligned.channels:
+            st.info("Mini-sector map not available: position data is missing for at least one of the selected laps.")
         else:
-            lap_number2 = int(selected_lap2.split()[1])
-            # Find the matching lap using numpy floor
-            matching_laps2 = driver2_laps[driver2_laps['LapNumber'].apply(lambda x: int(np.floor(x))) == lap_number2]
-            if not matching_laps2.empty:
-                lap_data2 = matching_laps2.iloc[0]
-                telemetry2 = lap_data2.get_telemetry().copy()
-                lap_time2 = lap_data2['LapTime'].total_seconds()
-            else:
-                raise ValueError(f"Lap {lap_number2} not found for {driver2}")
-        
-        progress_bar.progress(80)
-        status_text.text("Preparing visualization...")
-        
-        # Ensure consistent data types for X, Y, Z columns
-        for col in ['X', 'Y', 'Z']:
-            if col in telemetry1.columns:
-                telemetry1[col] = telemetry1[col].astype(float)
-            if col in telemetry2.columns:
-                telemetry2[col] = telemetry2[col].astype(float)
-        
-        # Convert distance to kilometers
-        telemetry1['Distance_KM'] = telemetry1['Distance'] / 1000
-        telemetry2['Distance_KM'] = telemetry2['Distance'] / 1000
-        
-        # Display lap times with new formatting
-        time_delta = abs(lap_time1 - lap_time2)
-        st.markdown(f"""
-        #### Lap Times:
-        - **{driver1}**: {format_time(lap_time1)}
-        - **{driver2}**: {format_time(lap_time2)}
-        - **Delta**: {format_time(time_delta)}
-        """)
-        
-        progress_bar.progress(90)
-        status_text.text("Generating plots...")
-        
-        # Create comparison plots
-        def create_comparison_plot(y_variable, title, y_label):
-            fig = go.Figure()
-            
-            # Add traces for both drivers
-            fig.add_trace(go.Scatter(x=telemetry1['Distance_KM'], y=telemetry1[y_variable],
-                                   name=f"{driver1}", line=dict(color='blue')))
-            fig.add_trace(go.Scatter(x=telemetry2['Distance_KM'], y=telemetry2[y_variable],
-                                   name=f"{driver2}", line=dict(color='red')))
-            
-            # Update layout
-            fig.update_layout(title=title,
-                            xaxis_title='Distance (km)',
-                            yaxis_title=y_label,
-                            hovermode='x unified')
-            return fig
-        
-        # Speed comparison
-        st.plotly_chart(create_comparison_plot('Speed', 'Speed Comparison', 'Speed (km/h)'))
-        
-        # Throttle comparison
-        st.plotly_chart(create_comparison_plot('Throttle', 'Throttle Application Comparison', 'Throttle %'))
-        
-        # Brake comparison
-        st.plotly_chart(create_comparison_plot('Brake', 'Brake Application Comparison', 'Brake %'))
+            edges = aligned.mini_sector_edges(n_sectors)
+            x = aligned.channels['X'][ref]
+            y = aligned.channels['Y'][ref]
+            fig_sectors = go.Figure()
+            for i, driver in enumerate(selected_drivers):
+                sectors = np.flatnonzero(winners == i)
+                if not len(sectors):
+                    continue
+                # Consecutive sectors of a driver are one trace, NaN breaks the line between them
+                sector_x, sector_y = [], []
+                for sector in sectors:
+                    sector_x.extend(x[edges[sector]:edges[sector + 1] + 1].tolist() + [np.nan])
+                    sector_y.extend(y[edges[sector]:edges[sector + 1] + 1].tolist() + [np.nan])
+                fig_sectors.add_trace(go.Scatter(x=sector_x, y=sector_y, mode='lines',
+                                               name=f"{driver} ({len(sectors)})",
+                                               line=dict(color=colors[driver], width=6)))
+            fig_sectors.update_layout(title='Mini-Sector Winners',
+                                    xaxis=dict(visible=False),
+                                    yaxis=dict(visible=False, scaleanchor='x', scaleratio=1))
+            # Sent as is, downsampling would drop the NaN separators and join the sectors up
+            with span('plotly_chart'):
+                st.plotly_chart(fig_sectors)
         
         # Clear progress indicators
-        progress_bar.progress(100)
-        status_text.empty()
+        progress.done()
     
     except Exception as e:
         # Clear progress indicators in case of error
-        if 'progress_bar' in locals():
-            progress_bar.empty()
-        if 'status_text' in locals():
-            status_text.empty()
+        if 'progress' in locals():
+            progress.clear()
             
         st.error(f"Error loading session data: {str(e)}")
         if "Event Schedule" in str(e):
@@ -1,100 +1,148 @@
 import streamlit as st
-import fastf1
-import fastf1.plotting
-import matplotlib.pyplot as plt
-import numpy as np
+import plotly.graph_objects as go
+from session_cache import load_session
+from prefetch import prefetch_related
+from gear_map import get_gear_map
+from lap_table import get_lap_table
+from telemetry_store import has_lap_telemetry
+from track_heatmap import get_track_heatmap, HEATMAP_METRICS, DEFAULT_CELL_SIZE
+from downsampling import show_plotly_chart
+from schedule_index import get_event_names
+from utils import SEASONS
+from tracing import PageProgress
+
+# Parts of the session this page uses, see session_cache.LOAD_PROFILES. The fastest lap's telemetry
+# comes from the telemetry store or caches, car and position data are loaded only when it is missing there.
+# The heat map bins the car and position data of every lap, it always loads them
+LOAD_PROFILE = 'laps'
+TELEMETRY_PROFILE = 'telemetry'
+
+# Traced stages, the progress bar advances by their measured duration
+STAGES = ['load', 'filter', 'figure', 'render']
+HEATMAP_STAGES = ['load', 'aggregate', 'figure']
+
+# Color scales of the heat map metrics, low to high
+_HEATMAP_COLORSCALES = {
+    'mean_gear': 'RdYlBu_r',
+    'min_speed': 'Viridis',
+    'brake_frequency': 'Reds',
+}
+
+def show_gear_heatmap(year, selected_race, session_type):
+    """Gear, speed and braking heat map over every lap of one or all drivers"""
+    try:
+        progress = PageProgress('gear_heatmap', HEATMAP_STAGES)
+        progress.set_session(year, selected_race, session_type)
+        
+        progress.stage('load', "Loading session data...")
+        session = load_session(year, selected_race, session_type, profile=TELEMETRY_PROFILE)
+        prefetch_related(year, selected_race, session_type)
+        
+        col1, col2, col3 = st.columns(3)
+        metric = col1.selectbox("Metric", list(HEATMAP_METRICS), format_func=HEATMAP_METRICS.get)
+        cell_size = col2.select_slider("Cell Size (m)", [10, 20, 40, 80], value=DEFAULT_CELL_SIZE)
+        
+        # Telemetry of the whole session is binned once per cell size, driver subsets are cheap sums
+        progress.stage('aggregate', "Binning telemetry...")
+        heatmap = get_track_heatmap(session, cell_size)
+        drivers = col3.selectbox("Drivers", ["All Drivers"] + heatmap.drivers)
+        values = heatmap.aggregate(None if drivers == "All Drivers" else [drivers])[metric]
+        
+        progress.stage('figure', "Generating visualization...")
+        fig = go.Figure(go.Heatmap(
+            x=heatmap.x_centers / 10,
+            y=heatmap.y_centers / 10,
+            # Heatmap rows are y, the grid is indexed [x, y]
+            z=values.T,
+            colorscale=_HEATMAP_COLORSCALES[metric],
+            colorbar=dict(title=HEATMAP_METRICS[metric]),
+            hoverongaps=False,
+            hovertemplate=f"X: %{{x:.0f}} m<br>Y: %{{y:.0f}} m<br>{HEATMAP_METRICS[metric]}: %{{z:.2f}}<extra></extra>",
+        ))
+        fig.update_layout(
+            title=f"{HEATMAP_METRICS[metric]} - {drivers} - {selected_race} {year}",
+            xaxis=dict(title="X Position (m)", showgrid=False, zeroline=False),
+            yaxis=dict(title="Y Position (m)", showgrid=False, zeroline=False, scaleanchor='x', scaleratio=1),
+            height=700,
+        )
+        show_plotly_chart(fig, use_container_width=True)
+        st.caption(f"{int(heatmap.counts.sum()):,} telemetry samples in "
+                   f"{int((heatmap.counts.sum(axis=0) > 0).sum())} cells of {cell_size} m")
+        
+        progress.done()
+        
+    except Exception as e:
+        if 'progress' in locals():
+            progress.clear()
+        st.error(f"An error occurred while loading the data: {str(e)}")
 
 def show_gear_shift_page():
     st.title("Gear Shift Analysis")
     
     # Session selection
-    year = st.selectbox("Select Year", range(2024, 2017, -1))
+    year = st.selectbox("Select Year", SEASONS)
     
     # Get list of races for the selected year
     with st.spinner("Loading race calendar..."):
-        fastf1.Cache.enable_cache('cache')
-        schedule = fastf1.get_event_schedule(year)
-        races = schedule['EventName'].tolist()
+        races = get_event_names(year)
     selected_race = st.selectbox("Select Race", races)
     
     # Session type selection
     session_type = st.selectbox("Select Session", ['Q', 'R', 'SQ', 'FP1', 'FP2', 'FP3'])
     
-    # Driver selection
-    drivers = ['VER', 'PER', 'HAM', 'RUS', 'LEC', 'SAI', 'NOR', 'PIA', 'ALO', 'STR',
-               'GAS', 'OCO', 'ALB', 'SAR', 'BOT', 'ZHO', 'TSU', 'RIC', 'MAG', 'HUL']
-    selected_driver = st.selectbox("Select Driver", drivers)
+    # Field heat map over every lap instead of a single driver's fastest lap
+    mode = st.radio("Mode", ["Fastest Lap", "Field Heat Map"], horizontal=True)
+    if mode == "Field Heat Map":
+        show_gear_heatmap(year, selected_race, session_type)
+        return
+    
+    # The session's lap data is loaded once here, it lists the drivers and the button below uses it
+    try:
+        with st.spinner("Loading session data..."):
+            session = load_session(year, selected_race, session_type, profile=LOAD_PROFILE)
+    except Exception as e:
+        st.error(f"An error occurred while loading the data: {str(e)}")
+        return
+    lap_table = get_lap_table(session)
+    selected_driver = st.selectbox("Select Driver", lap_table.drivers)
 
     if st.button("Generate Gear Shift Visualization"):
         try:
             # Create progress indicators
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            # Load session data
-            status_text.text("Loading session data...")
-            progress_bar.progress(10)
+            progress = PageProgress('gear_shift', STAGES)
+            progress.set_session(year, selected_race, session_type)
+            progress.stage('load', "Loading session data...")
             
-            session = fastf1.get_session(year, selected_race, session_type)
-            progress_bar.progress(30)
+            # Warm up the rest of the weekend and the adjacent rounds in the background
+            prefetch_related(year, selected_race, session_type)
             
-            status_text.text("Processing telemetry data...")
-            session.load()
-            progress_bar.progress(50)
+            progress.stage('filter', "Processing telemetry data...")
             
-            # Get fastest lap for selected driver
-            driver_laps = session.laps.pick_driver(selected_driver)
-            if len(driver_laps) == 0:
+            # Get fastest lap for selected driver from the lap index
+            if not lap_table.lap_numbers(selected_driver):
                 raise ValueError(f"No lap data found for {selected_driver}")
                 
-            fastest_lap = driver_laps.pick_fastest()
+            fastest_lap = lap_table.fastest_lap(session, selected_driver)
             if fastest_lap is None:
                 raise ValueError(f"No valid fastest lap found for {selected_driver}")
-                
-            progress_bar.progress(60)
             
-            # Get telemetry data
-            status_text.text("Getting telemetry data...")
-            telemetry = fastest_lap.get_telemetry()
-            if telemetry is None or len(telemetry) == 0:
-                raise ValueError("No telemetry data available for this lap")
+            # A lap missing from the telemetry store and caches is merged by FastF1 from car and position data
+            if not has_lap_telemetry(session, [fastest_lap]):
+                session = load_session(year, selected_race, session_type, profile=TELEMETRY_PROFILE)
+                fastest_lap = session.laps.loc[fastest_lap.name]
                 
-            progress_bar.progress(70)
-            
-            # Prepare the plot
-            status_text.text("Generating visualization...")
-            fastf1.plotting.setup_mpl(mpl_timedelta_support=True)
-            
-            fig, ax = plt.subplots(figsize=(12, 8))
-            
-            # Create colormap for gears
-            num_gears = len(np.unique(telemetry['nGear']))
-            cmap = plt.cm.get_cmap('RdYlBu_r')
-            
-            # Plot the circuit with color-coded gears
-            points = ax.scatter(telemetry['X'], telemetry['Y'],
-                              c=telemetry['nGear'], 
-                              cmap=cmap,
-                              s=30,
-                              vmin=1,
-                              vmax=8)
-            
-            # Add colorbar
-            cbar = plt.colorbar(points)
-            cbar.set_label('Gear')
-            
-            # Set title and labels
-            plt.title(f"Fastest Lap Gear Shift Visualization\n{selected_driver} - {selected_race} {year}")
-            ax.set_xlabel("X Position (m)")
-            ax.set_ylabel("Y Position (m)")
-            
-            # Set aspect ratio to equal for true track shape
-            ax.set_aspect('equal')
-            
-            progress_bar.progress(90)
+            # Gear segments and figure are built once per session, driver and lap
+            progress.stage('figure', "Generating visualization...")
+            gear_map = get_gear_map(
+                session, fastest_lap,
+                f"Fastest Lap Gear Shift Visualization<br>{selected_driver} - {selected_race} {year}")
             
             # Display the plot
-            st.pyplot(fig)
+            progress.stage('render', "Rendering visualization...")
+            # One trace per gear holds at most one lap of samples, below the downsampling threshold,
+            # so the cached figure and the NaN breaks between its segments are sent unchanged
+            show_plotly_chart(gear_map.figure, use_container_width=True)
+            st.caption(f"{len(gear_map.segments)} gear segments")
             
             # Display fastest lap information
             st.subheader("Fastest Lap Information")
@@ -104,7 +152,7 @@ def show_gear_shift_page():
                 "Compound": fastest_lap['Compound'] if 'Compound' in fastest_lap else None,
                 "Stint": int(fastest_lap['Stint']) if 'Stint' in fastest_lap else None,
                 "Fresh Tyre": "Yes" if fastest_lap.get('FreshTyre', False) else "No",
-                "DRS Activations": len(telemetry[telemetry['DRS'] > 0]) if 'DRS' in telemetry else "N/A"
+                "DRS Activations": gear_map.drs_samples if gear_map.drs_samples is not None else "N/A"
             }
             
             # Filter out None values
@@ -113,15 +161,12 @@ def show_gear_shift_page():
             st.json(lap_info)
             
             # Clear progress indicators
-            progress_bar.progress(100)
-            status_text.empty()
+            progress.done()
             
         except Exception as e:
             # Clear progress indicators in case of error
-            if 'progress_bar' in locals():
-                progress_bar.empty()
-            if 'status_text' in locals():
-                status_text.empty()
+            if 'progress' in locals():
+                progress.clear()
                 
             st.error(f"An error occurred while loading the data: {str(e)}")
             st.info("This could be due to:\n"
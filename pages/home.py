@@ -1,6 +1,4 @@
 import streamlit as st
-import matplotlib.pyplot as plt
-import fastf1.plotting
 
 def show_home_page():
     st.title("F1 Data Analysis Dashboard")
@@ -16,8 +14,8 @@ def show_home_page():
        - Compare different laps from the same session
     
     2. **Driver Comparison**
-       - Compare telemetry data between two drivers
-       - Analyze speed differences
+       - Compare telemetry data of up to ten drivers
+       - Analyze time deltas and mini-sector winners
        - Compare throttle and brake usage
     
     3. **Position Changes**
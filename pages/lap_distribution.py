@@ -5,18 +5,28 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
+from session_cache import load_session
+from prefetch import prefetch_related
+from lap_stats import get_lap_stats
+from schedule_index import get_event_names
+from utils import SEASONS
+from tracing import PageProgress
+
+# Parts of the session this page uses, see session_cache.LOAD_PROFILES
+LOAD_PROFILE = 'laps'
+
+# Traced stages, the progress bar advances by their measured duration
+STAGES = ['load', 'statistics', 'figure', 'render', 'table']
 
 def show_lap_distribution_page():
     st.title("Lap Time Distribution Analysis")
     
     # Session selection
-    year = st.selectbox("Select Year", range(2024, 2017, -1))
+    year = st.selectbox("Select Year", SEASONS)
     
     # Get list of races for the selected year
     with st.spinner("Loading race calendar..."):
-        fastf1.Cache.enable_cache('cache')
-        schedule = fastf1.get_event_schedule(year)
-        races = schedule['EventName'].tolist()
+        races = get_event_names(year)
     selected_race = st.selectbox("Select Race", races)
     
     # Session type selection
@@ -26,39 +36,30 @@ def show_lap_distribution_page():
     if st.button("Generate Distribution Plot"):
         try:
             # Create a placeholder for the progress bar
-            progress_bar = st.progress(0)
-            status_text = st.empty()
+            progress = PageProgress('lap_distribution', STAGES)
+            progress.set_session(year, selected_race, session_type)
             
             # Load the session
-            status_text.text("Loading session data...")
-            progress_bar.progress(10)
+            progress.stage('load', "Loading session data...")
+            session = load_session(year, selected_race, session_type, profile=LOAD_PROFILE)
+            
+            # Warm up the rest of the weekend and the adjacent rounds in the background
+            prefetch_related(year, selected_race, session_type)
             
-            session = fastf1.get_session(year, selected_race, session_type)
-            progress_bar.progress(30)
+            progress.stage('statistics', "Processing lap times...")
             
-            status_text.text("Processing lap times...")
-            session.load()
-            progress_bar.progress(50)
+            # Lap time aggregates are computed once per session and shared by the plot and the table
+            stats = get_lap_stats(session)
             
             point_finishers = session.drivers[:10]
-            driver_laps = session.laps.pick_drivers(point_finishers).pick_quicklaps()
-            driver_laps = driver_laps.reset_index()
-            progress_bar.progress(70)
-
             finishing_order = [session.get_driver(i)["Abbreviation"] for i in point_finishers]
+            driver_laps = stats.quicklaps[stats.quicklaps['Driver'].isin(finishing_order)]
             
-            # Get lap times for all drivers
-            status_text.text("Generating visualization...")
-            lap_times = session.laps
-            progress_bar.progress(80)
+            progress.stage('figure', "Generating visualization...")
             
             # create the figure
             fig, ax = plt.subplots(figsize=(10, 5))
 
-            # Seaborn doesn't have proper timedelta support,
-            # so we have to convert timedelta to float (in seconds)
-            driver_laps["LapTime(s)"] = driver_laps["LapTime"].dt.total_seconds()
-
             sns.violinplot(data=driver_laps,
                            x="Driver",
                            y="LapTime(s)",
@@ -86,31 +87,31 @@ def show_lap_distribution_page():
             sns.despine(left=True, bottom=True)
 
             plt.tight_layout()
-            progress_bar.progress(90)
             
             # Display plot in Streamlit
+            progress.stage('render', "Rendering visualization...")
             st.pyplot(plt)
             
             # Display summary statistics
-            status_text.text("Calculating statistics...")
+            progress.stage('table', "Calculating statistics...")
             st.subheader("Lap Time Summary Statistics")
-            summary = lap_times.groupby('Driver')['LapTime'].agg(['mean', 'min', 'max', 'count']).reset_index()
-            summary['mean'] = summary['mean'].dt.total_seconds()
-            summary['min'] = summary['min'].dt.total_seconds()
-            summary['max'] = summary['max'].dt.total_seconds()
-            summary.columns = ['Driver', 'Mean Time (s)', 'Best Time (s)', 'Worst Time (s)', 'Lap Count']
+            summary = stats.by_driver[['Driver', 'mean', 'median', 'min', 'max', 'std', 'count']]
+            summary.columns = ['Driver', 'Mean Time (s)', 'Median Time (s)', 'Best Time (s)',
+                               'Worst Time (s)', 'Std Dev (s)', 'Lap Count']
             st.dataframe(summary)
             
+            with st.expander("Statistics per Compound"):
+                st.dataframe(stats.by_compound)
+            with st.expander("Statistics per Stint"):
+                st.dataframe(stats.by_stint)
+            
             # Clear the progress indicators
-            progress_bar.progress(100)
-            status_text.empty()
+            progress.done()
             
         except Exception as e:
             # Clear the progress indicators in case of error
-            if 'progress_bar' in locals():
-                progress_bar.empty()
-            if 'status_text' in locals():
-                status_text.empty()
+            if 'progress' in locals():
+                progress.clear()
                 
             st.error(f"An error occurred while loading the data: {str(e)}")
             st.info("This could be due to:\n"
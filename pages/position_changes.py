@@ -3,8 +3,20 @@ import fastf1
 import plotly.graph_objects as go
 import pandas as pd
 from utils import get_year_selection
+from session_cache import load_session
+from prefetch import prefetch_related
+from positions import get_position_matrix
+from downsampling import show_plotly_chart
+from schedule_index import get_event_names
 import matplotlib.pyplot as plt
 import fastf1.plotting
+from tracing import PageProgress
+
+# Parts of the session this page uses, see session_cache.LOAD_PROFILES
+LOAD_PROFILE = 'laps'
+
+# Traced stages, the progress bar advances by their measured duration
+STAGES = ['schedule', 'load', 'positions', 'figure', 'render', 'table']
 
 def show_position_changes_page():
     st.title("Race Position Changes Analysis")
@@ -14,77 +26,58 @@ def show_position_changes_page():
     
     try:
         # Create progress indicators
-        progress_bar = st.progress(0)
-        status_text = st.empty()
+        progress = PageProgress('position_changes', STAGES)
         
-        status_text.text("Loading race calendar...")
-        progress_bar.progress(10)
+        progress.stage('schedule', "Loading race calendar...")
         
         # Load race schedule for selected year
-        schedule = fastf1.get_event_schedule(year)
-        race_names = schedule['EventName'].tolist()
+        race_names = get_event_names(year)
         selected_race = st.sidebar.selectbox("Select Race", race_names, key='pos_race')
         
-        status_text.text("Loading race data...")
-        progress_bar.progress(20)
+        progress.set_session(year, selected_race, 'R')
+        progress.stage('load', "Loading race data...")
         
         # Load race session with minimal data
-        session = fastf1.get_session(year, selected_race, 'R')
-        session.load()
+        session = load_session(year, selected_race, 'R', profile=LOAD_PROFILE)
+        
+        # Warm up the rest of the weekend and the adjacent rounds in the background
+        prefetch_related(year, selected_race, 'R')
         
-        status_text.text("Processing driver data...")
-        progress_bar.progress(40)
+        progress.stage('positions', "Processing driver data...")
+        
+        # Positions of every driver on every lap, built once per session
+        matrix = get_position_matrix(session)
         
         # Create position changes plot
+        progress.stage('figure', "Generating position changes visualization...")
         fig = go.Figure()
         
-        # Get teams and their drivers
-        team_drivers = {}
-        for drv in session.drivers:
-            drv_laps = session.laps.pick_driver(drv)
-            if not drv_laps.empty:
-                team = drv_laps['Team'].iloc[0]
-                if team not in team_drivers:
-                    team_drivers[team] = []
-                team_drivers[team].append(drv)
-        
-        status_text.text("Generating position changes visualization...")
-        progress_bar.progress(60)
-        
-        # Add traces for each driver
-        for team, drivers in team_drivers.items():
-            for i, drv in enumerate(drivers):
-                drv_laps = session.laps.pick_driver(drv)
+        # Add traces for each driver, grouped by team
+        for team, drivers in matrix.team_drivers().items():
+            for i, abb in enumerate(drivers):
+                driver_full_name = matrix.full_names[abb]
+                
+                # Get FastF1's built-in driver styling
+                style = fastf1.plotting.get_driver_style(identifier=abb,
+                                                       style=['color'],
+                                                       session=session)
                 
-                if not drv_laps.empty:
-                    # Get driver's abbreviation and full name
-                    abb = drv_laps['Driver'].iloc[0]
-                    driver_full_name = session.get_driver(abb)['FullName']
-                    
-                    # Get FastF1's built-in driver styling
-                    style = fastf1.plotting.get_driver_style(identifier=abb,
-                                                           style=['color'],
-                                                           session=session)
-                    
-                    # Alternate between solid and dash for teammates
-                    line_style = 'solid' if i == 0 else 'dash'
-                    
-                    # Create the line plot with F1 styling
-                    fig.add_trace(go.Scatter(
-                        x=drv_laps['LapNumber'],
-                        y=drv_laps['Position'],
-                        name=f"{abb} - {driver_full_name}",
-                        line=dict(
-                            color=style['color'],
-                            dash=line_style
-                        ),
-                        mode='lines',
-                        hovertemplate="Lap: %{x}<br>Position: %{y}<br>%{text}",
-                        text=[f"{abb} - {driver_full_name} ({team})" for _ in range(len(drv_laps))]
-                    ))
-        
-        progress_bar.progress(80)
-        status_text.text("Finalizing visualization...")
+                # Alternate between solid and dash for teammates
+                line_style = 'solid' if i == 0 else 'dash'
+                
+                # Create the line plot with F1 styling
+                fig.add_trace(go.Scatter(
+                    x=matrix.laps,
+                    y=matrix.row(abb),
+                    name=f"{abb} - {driver_full_name}",
+                    line=dict(
+                        color=style['color'],
+                        dash=line_style
+                    ),
+                    mode='lines',
+                    # Driver label is constant per trace, so keep it in the template instead of per point
+                    hovertemplate=f"Lap: %{{x}}<br>Position: %{{y}}<br>{abb} - {driver_full_name} ({team})"
+                ))
         
         # Update layout
         fig.update_layout(
@@ -109,58 +102,32 @@ def show_position_changes_page():
         )
         
         # Display the plot
-        st.plotly_chart(fig, use_container_width=True)
+        progress.stage('render', "Finalizing visualization...")
+        show_plotly_chart(fig, use_container_width=True)
         
-        status_text.text("Calculating race statistics...")
-        progress_bar.progress(90)
+        progress.stage('table', "Calculating race statistics...")
         
         # Add race statistics
         st.subheader("Race Statistics")
         
-        # Calculate position changes for each driver
-        driver_stats = []
-        for drv in session.drivers:
-            drv_laps = session.laps.pick_driver(drv)
-            if not drv_laps.empty:
-                abb = drv_laps['Driver'].iloc[0]
-                driver_full_name = session.get_driver(abb)['FullName']
-                team = drv_laps['Team'].iloc[0]
-                
-                start_pos = drv_laps['Position'].iloc[0]
-                end_pos = drv_laps['Position'].iloc[-1]
-                
-                # Handle NaN values
-                if pd.isna(start_pos) or pd.isna(end_pos):
-                    continue
-                    
-                positions_gained = int(start_pos - end_pos)
-                
-                driver_stats.append({
-                    'Driver': f"{abb} - {driver_full_name}",
-                    'Team': team,
-                    'Start': int(start_pos),
-                    'Finish': int(end_pos),
-                    'Positions Gained/Lost': positions_gained
-                })
+        # Positions gained/lost come straight from the position matrix
+        driver_stats = matrix.changes()
         
         # Display statistics as a table
         st.dataframe(
-            pd.DataFrame(driver_stats)
+            driver_stats
             .sort_values(['Team', 'Finish'])
             .reset_index(drop=True),
             hide_index=True
         )
         
         # Clear progress indicators
-        progress_bar.progress(100)
-        status_text.empty()
+        progress.done()
     
     except Exception as e:
         # Clear progress indicators in case of error
-        if 'progress_bar' in locals():
-            progress_bar.empty()
-        if 'status_text' in locals():
-            status_text.empty()
+        if 'progress' in locals():
+            progress.clear()
             
         st.error(f"Error loading race data: {str(e)}")
         if "Event Schedule" in str(e):
@@ -1,8 +1,20 @@
 import streamlit as st
-import fastf1
-import plotly.express as px
-import numpy as np
-from utils import get_year_selection, format_time
+from utils import get_year_selection, format_time, SESSION_IDENTIFIERS
+from session_cache import load_session
+from prefetch import prefetch_related
+from figure_cache import show_subplots
+from telemetry_store import get_lap_telemetry, has_lap_telemetry
+from lap_table import get_lap_table
+from schedule_index import get_event_names
+from tracing import PageProgress
+
+# Parts of the session this page uses, see session_cache.LOAD_PROFILES. Lap telemetry comes
+# from the telemetry store or caches, car and position data are loaded only for laps missing there
+LOAD_PROFILE = 'laps'
+TELEMETRY_PROFILE = 'telemetry'
+
+# Traced stages, the progress bar advances by their measured duration
+STAGES = ['schedule', 'load', 'filter', 'telemetry', 'figure']
 
 def show_telemetry_page():
     st.title("Telemetry Analysis")
@@ -12,38 +24,28 @@ def show_telemetry_page():
     
     try:
         # Create progress indicators
-        progress_bar = st.progress(0)
-        status_text = st.empty()
+        progress = PageProgress('telemetry', STAGES)
         
-        status_text.text("Loading race calendar...")
-        progress_bar.progress(10)
+        progress.stage('schedule', "Loading race calendar...")
         
         # Load race schedule for selected year
-        schedule = fastf1.get_event_schedule(year)
-        race_names = schedule['EventName'].tolist()
+        race_names = get_event_names(year)
         selected_race = st.sidebar.selectbox("Select Race", race_names, key='telemetry_race')
         
         # Session selection
-        session_types = {
-            'Practice 1': 'FP1',
-            'Practice 2': 'FP2',
-            'Practice 3': 'FP3',
-            'Qualifying': 'Q',
-            'Sprint Shootout': 'SQ',
-            'Sprint': 'S',
-            'Race': 'R'
-        }
-        selected_session = st.sidebar.selectbox("Select Session", list(session_types.keys()), key='telemetry_session')
-        
-        status_text.text("Loading session data...")
-        progress_bar.progress(30)
+        selected_session = st.sidebar.selectbox("Select Session", list(SESSION_IDENTIFIERS), key='telemetry_session')
+        
+        progress.set_session(year, selected_race, SESSION_IDENTIFIERS[selected_session])
+        progress.stage('load', "Loading session data...")
         
         # Load session data
-        session = fastf1.get_session(year, selected_race, session_types[selected_session])
-        session.load()
+        session = load_session(year, selected_race, SESSION_IDENTIFIERS[selected_session], profile=LOAD_PROFILE)
         
-        progress_bar.progress(50)
-        status_text.text("Processing driver data...")
+        # Warm up the rest of the weekend and the adjacent rounds in the background
+        prefetch_related(year, selected_race, SESSION_IDENTIFIERS[selected_session])
+        
+        # Compact lap table with per-driver row offsets, built once per session
+        lap_table = get_lap_table(session)
         
         # Driver selection
         drivers = session.drivers
@@ -52,81 +54,56 @@ def show_telemetry_page():
         selected_driver = st.sidebar.selectbox("Select Driver", list(driver_info.keys()),
                                              format_func=lambda x: f"{x} - {driver_info[x]}")
         
-        status_text.text(f"Loading {selected_driver}'s lap data...")
-        progress_bar.progress(60)
-        
-        # Get driver's laps
-        driver_laps = session.laps.pick_driver(selected_driver)
-        
-        # Get fastest lap
-        fastest_lap = driver_laps.pick_fastest()
+        progress.stage('filter', f"Loading {selected_driver}'s lap data...")
         
-        # Convert lap numbers to integers and sort them
-        lap_numbers = sorted([int(np.floor(lap)) for lap in driver_laps['LapNumber'].unique()])
-        lap_options = ["Fastest Lap"] + [f"Lap {lap}" for lap in lap_numbers]
+        # Fastest lap and sorted lap numbers come precomputed from the lap index
+        fastest_lap = lap_table.fastest_lap(session, selected_driver)
+        lap_options = ["Fastest Lap"] + [f"Lap {lap}" for lap in lap_table.lap_numbers(selected_driver)]
         selected_lap = st.sidebar.selectbox("Select Lap", lap_options)
         
-        status_text.text("Processing telemetry data...")
-        progress_bar.progress(70)
+        progress.stage('telemetry', "Processing telemetry data...")
         
-        # Get telemetry data based on lap selection
+        # Look the selected lap up in the lap index
         if selected_lap == "Fastest Lap":
-            telemetry = fastest_lap.get_telemetry()
-            lap_time = fastest_lap['LapTime'].total_seconds()
-            st.header(f"{selected_session} Fastest Lap Telemetry for {driver_info[selected_driver]}")
-            st.subheader(f"Lap Time: {format_time(lap_time)}")
+            lap = fastest_lap
+            if lap is None:
+                raise ValueError(f"No valid fastest lap found for {selected_driver}")
+            title = f"{selected_session} Fastest Lap Telemetry for {driver_info[selected_driver]}"
         else:
             lap_number = int(selected_lap.split()[1])
-            # Find the first matching lap (in case of partial laps)
-            matching_laps = driver_laps[driver_laps['LapNumber'].apply(lambda x: int(np.floor(x))) == lap_number]
-            if not matching_laps.empty:
-                lap_data = matching_laps.iloc[0]
-                telemetry = lap_data.get_telemetry()
-                lap_time = lap_data['LapTime'].total_seconds()
-                st.header(f"{selected_session} {selected_lap} Telemetry for {driver_info[selected_driver]}")
-                st.subheader(f"Lap Time: {format_time(lap_time)}")
-            else:
+            # First lap with this number (in case of partial laps), looked up in the lap index
+            lap = lap_table.lap(session, selected_driver, lap_number)
+            if lap is None:
                 raise ValueError(f"Lap {lap_number} not found for {selected_driver}")
-        
-        status_text.text("Generating visualizations...")
-        progress_bar.progress(80)
-        
-        # Convert distance to kilometers for better readability
-        telemetry['Distance_KM'] = telemetry['Distance'] / 1000
-        
-        # Speed plot
-        fig_speed = px.line(telemetry, x='Distance_KM', y='Speed',
-                           title='Speed Telemetry',
-                           labels={'Distance_KM': 'Distance (km)',
-                                 'Speed': 'Speed (km/h)'})
-        st.plotly_chart(fig_speed)
-        
-        progress_bar.progress(90)
-        
-        # Throttle plot
-        fig_throttle = px.line(telemetry, x='Distance_KM', y='Throttle',
-                              title='Throttle Application',
-                              labels={'Distance_KM': 'Distance (km)',
-                                    'Throttle': 'Throttle %'})
-        st.plotly_chart(fig_throttle)
-        
-        # Brake plot
-        fig_brake = px.line(telemetry, x='Distance_KM', y='Brake',
-                           title='Brake Application',
-                           labels={'Distance_KM': 'Distance (km)',
-                                 'Brake': 'Brake %'})
-        st.plotly_chart(fig_brake)
+            title = f"{selected_session} {selected_lap} Telemetry for {driver_info[selected_driver]}"
+        
+        # A lap missing from the telemetry store and caches is merged by FastF1 from car and position data
+        if not has_lap_telemetry(session, [lap]):
+            session = load_session(year, selected_race, SESSION_IDENTIFIERS[selected_session], profile=TELEMETRY_PROFILE)
+            lap = session.laps.loc[lap.name]
+        telemetry = get_lap_telemetry(session, lap)
+        st.header(title)
+        st.subheader(f"Lap Time: {format_time(lap['LapTime'].total_seconds())}")
+        
+        progress.stage('figure', "Generating visualizations...")
+        
+        # Distance in kilometers is precomputed by the telemetry cache
+        # Speed, throttle and brake share one figure and its distance axis,
+        # traces are cached by content so an unchanged lap is not rebuilt or re-sent
+        show_subplots(['Speed (km/h)', 'Throttle %', 'Brake %'],
+                      [(row, telemetry['Distance_KM'], telemetry[channel], {'name': channel, 'showlegend': False})
+                       for row, channel in enumerate(['Speed', 'Throttle', 'Brake'])],
+                      {'title': 'Speed, Throttle and Brake Telemetry',
+                       'xaxis3': {'title': 'Distance (km)'},
+                       'hovermode': 'x unified'})
         
         # Clear progress indicators
-        progress_bar.progress(100)
-        status_text.empty()
+        progress.done()
     
     except Exception as e:
         # Clear progress indicators in case of error
-        if 'progress_bar' in locals():
-            progress_bar.empty()
-        if 'status_text' in locals():
-            status_text.empty()
+        if 'progress' in locals():
+            progress.clear()
             
         st.error(f"Error loading session data: {str(e)}")
         if "Event Schedule" in str(e):
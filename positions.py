@@ -0,0 +1,144 @@
+import argparse
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from telemetry_store import session_key
+
+# Number of position matrices kept in memory, least recently used ones are dropped first
+MAX_MATRICES = 16
+
+
+class PositionMatrix:
+    """Race positions of every driver on every lap, built in one pivot
+
+    ``positions`` is a (drivers x laps) float array padded with NaN for laps a
+    driver did not complete or has no position for.
+    """
+
+    def __init__(self, drivers, laps, positions, teams, full_names, start, finish):
+        self.drivers = drivers
+        self.laps = laps
+        self.positions = positions
+        self.teams = teams
+        self.full_names = full_names
+        self.start = start
+        self.finish = finish
+
+    @classmethod
+    def from_session(cls, session):
+        laps = pd.DataFrame(session.laps[['Driver', 'Team', 'LapNumber', 'Position']])
+        laps = laps.dropna(subset=['LapNumber']).sort_values(['Driver', 'LapNumber'], kind='stable')
+
+        # Drivers in session (results) order, restricted to those with laps
+        results = session.results
+        with_laps = set(laps['Driver'])
+        drivers = [abb for abb in results['Abbreviation'] if abb in with_laps]
+
+        pivot = laps.pivot_table(index='Driver', columns='LapNumber', values='Position', aggfunc='first')
+        lap_numbers = np.arange(1, int(laps['LapNumber'].max()) + 1)
+        pivot = pivot.reindex(index=drivers, columns=lap_numbers)
+
+        # Start and finish are the positions on a driver's first and last recorded lap
+        first = laps.drop_duplicates('Driver', keep='first').set_index('Driver')
+        last = laps.drop_duplicates('Driver', keep='last').set_index('Driver')
+
+        return cls(
+            drivers=drivers,
+            laps=lap_numbers,
+            positions=np.ascontiguousarray(pivot.to_numpy(dtype=float)),
+            teams=first['Team'].reindex(drivers).to_dict(),
+            full_names=results.set_index('Abbreviation')['FullName'].reindex(drivers).to_dict(),
+            start=first['Position'].reindex(drivers).to_numpy(dtype=float),
+            finish=last['Position'].reindex(drivers).to_numpy(dtype=float),
+        )
+
+    def team_drivers(self):
+        """Drivers grouped by team, in the order the teams first appear"""
+        grouped = {}
+        for drv in self.drivers:
+            grouped.setdefault(self.teams[drv], []).append(drv)
+        return grouped
+
+    def row(self, driver):
+        return self.positions[self.drivers.index(driver)]
+
+    def changes(self):
+        """Start, finish and positions gained/lost per driver, skipping missing positions"""
+        valid = ~(np.isnan(self.start) | np.isnan(self.finish))
+        drivers = [drv for drv, ok in zip(self.drivers, valid) if ok]
+        start = self.start[valid].astype(int)
+        finish = self.finish[valid].astype(int)
+        return pd.DataFrame({
+            'Driver': [f"{drv} - {self.full_names[drv]}" for drv in drivers],
+            'Team': [self.teams[drv] for drv in drivers],
+            'Start': start,
+            'Finish': finish,
+            'Positions Gained/Lost': start - finish,
+        })
+
+
+_matrices = OrderedDict()
+_matrices_lock = threading.Lock()
+
+
+def get_position_matrix(session):
+    """Common function to get a session's position matrix, building it only once"""
+    key = session_key(session)
+    with _matrices_lock:
+        matrix = _matrices.get(key)
+        if matrix is not None:
+            _matrices.move_to_end(key)
+            return matrix
+
+    matrix = PositionMatrix.from_session(session)
+    with _matrices_lock:
+        _matrices[key] = matrix
+        while len(_matrices) > MAX_MATRICES:
+            _matrices.popitem(last=False)
+    return matrix
+
+
+def _per_driver_changes(session):
+    # The previous approach: filter the laps once per driver
+    stats = []
+    for drv in session.drivers:
+        drv_laps = session.laps.pick_driver(drv)
+        if not drv_laps.empty:
+            stats.append((drv_laps['Position'].iloc[0], drv_laps['Position'].iloc[-1]))
+    return stats
+
+
+def main():
+    import fastf1
+    from session_cache import load_session
+
+    parser = argparse.ArgumentParser(description="Benchmark the position matrix on a race")
+    parser.add_argument('year', type=int)
+    parser.add_argument('event')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    os.makedirs('cache', exist_ok=True)
+    fastf1.Cache.enable_cache('cache')
+    session = load_session(args.year, args.event, 'R', profile='laps')
+
+    def best_of(func):
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            func(session)
+            timings.append(time.perf_counter() - start)
+        return min(timings) * 1000
+
+    print(f"{len(session.drivers)} drivers, {len(session.laps)} laps")
+    print(f"per-driver pick_driver loop: {best_of(_per_driver_changes):.1f} ms (x3 on the old page)")
+    print(f"position matrix:             {best_of(PositionMatrix.from_session):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import argparse
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from session_cache import session_cache, LOAD_PROFILES
+from schedule_index import get_schedule_index
+from tracing import trace_labels
+from utils import SESSION_IDENTIFIERS
+
+_logger = logging.getLogger(__name__)
+
+# Number of background loader threads, 0 disables prefetching in the dashboard
+DEFAULT_WORKERS = int(os.environ.get('F1_PREFETCH_WORKERS', '2'))
+
+# Share of the session cache budget that must be free for the dashboard to prefetch
+MIN_HEADROOM = 0.25
+
+
+def weekend_sessions(year, event):
+    """Session identifiers held at an event, in schedule order"""
+    names = get_schedule_index().sessions(year, event)
+    identifiers = [SESSION_IDENTIFIERS[name] for name in names if name in SESSION_IDENTIFIERS]
+    return list(dict.fromkeys(identifiers))
+
+
+def adjacent_events(year, event):
+    """The championship rounds directly before and after an event"""
+    index = get_schedule_index()
+    rounds = [name for name in index.event_names(year) if index.round_number(year, name) > 0]
+    if event not in rounds:
+        return []
+    position = rounds.index(event)
+    return [rounds[i] for i in (position - 1, position + 1) if 0 <= i < len(rounds)]
+
+
+def related_sessions(year, event, session_type):
+    """Sessions a user is likely to open next: the rest of the weekend, then adjacent rounds"""
+    related = [(year, event, other) for other in weekend_sessions(year, event) if other != session_type]
+    related += [(year, other, session_type) for other in adjacent_events(year, event)]
+    return related
+
+
+class Prefetcher:
+    """Loads sessions into the shared session cache on background threads
+
+    Prefetched sessions are stored at low priority, so they never displace a
+    session a page loaded.
+    """
+
+    def __init__(self, cache=session_cache, max_workers=DEFAULT_WORKERS, ingest_telemetry=False):
+        self.cache = cache
+        self.max_workers = max_workers
+        self.ingest_telemetry = ingest_telemetry
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='prefetch') if max_workers > 0 else None
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def submit(self, year, event, session_type, profile='laps'):
+        """Queue a session for loading unless it is already cached or queued"""
+        if self._executor is None:
+            return None
+        key = (year, event, session_type, profile)
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None:
+                return future
+            if self.cache.contains(year, event, session_type, profile) and not self.ingest_telemetry:
+                return None
+            future = self._executor.submit(self._load, year, event, session_type, profile)
+            self._futures[key] = future
+        # Outside the lock, the callback runs right away if the load already finished
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._futures.get(key) is future:
+                del self._futures[key]
+
+    def _load(self, year, event, session_type, profile):
+        try:
+            with trace_labels(page='prefetch', session=f"{year} {event} {session_type}"):
+                session = self.cache.load(year, event, session_type, profile=profile, prefetch=True)
+                if self.ingest_telemetry and LOAD_PROFILES[profile]['telemetry']:
+                    from telemetry_store import ingest_session
+                    ingest_session(session)
+            _logger.info("Prefetched %s %s %s", year, event, session_type)
+        except Exception as e:
+            # Prefetching is best effort, the page reports errors when the session is actually opened
+            _logger.warning("Failed to prefetch %s %s %s: %s", year, event, session_type, e)
+            raise
+
+    def pending(self):
+        with self._lock:
+            return sum(not future.done() for future in self._futures.values())
+
+    def wait(self, timeout=None):
+        with self._lock:
+            futures = list(self._futures.values())
+        return wait(futures, timeout=timeout)
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+# Module level instance shared by every page
+prefetcher = Prefetcher()
+
+
+def prefetch_related(year, event, session_type, profile='laps'):
+    """Common function to warm up the sessions related to the one being viewed
+
+    Only lap data is prefetched by default, a page that needs telemetry
+    upgrades the cached session in place. Nothing is prefetched while the
+    session cache is close to its budget.
+    """
+    if prefetcher.max_workers <= 0:
+        return
+    if prefetcher.cache.free_bytes < MIN_HEADROOM * prefetcher.cache.max_bytes:
+        return
+    try:
+        related = related_sessions(year, event, session_type)
+    except KeyError:
+        # event not in the schedule index, nothing sensible to prefetch
+        return
+    for related_year, related_event, related_type in related:
+        prefetcher.submit(related_year, related_event, related_type, profile=profile)
+
+
+def main():
+    import fastf1
+
+    parser = argparse.ArgumentParser(description="Download and parse sessions ahead of a race weekend")
+    parser.add_argument('year', type=int)
+    parser.add_argument('events', nargs='*', help="Event names, defaults to the whole season")
+    parser.add_argument('--sessions', nargs='+', help="Session identifiers, defaults to every session of the weekend")
+    parser.add_argument('--profile', default='full', choices=list(LOAD_PROFILES))
+    parser.add_argument('--workers', type=int, default=max(DEFAULT_WORKERS, 1))
+    parser.add_argument('--ingest', action='store_true', help="Also precompute the per-lap telemetry store")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    os.makedirs('cache', exist_ok=True)
+    fastf1.Cache.enable_cache('cache')
+
+    index = get_schedule_index()
+    events = args.events or [name for name in index.event_names(args.year)
+                             if index.round_number(args.year, name) > 0]
+
+    warmup = Prefetcher(max_workers=args.workers, ingest_telemetry=args.ingest)
+    futures = []
+    for event in events:
+        for session_type in args.sessions or weekend_sessions(args.year, event):
+            future = warmup.submit(args.year, event, session_type, profile=args.profile)
+            if future is not None:
+                futures.append(future)
+    done, _ = wait(futures)
+    failed = sum(future.exception() is not None for future in done)
+    warmup.shutdown()
+    print(f"Prefetched {len(done) - failed} sessions, {failed} failed")
+
+
+if __name__ == "__main__":
+    main()
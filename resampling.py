@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+# Channels put on the common distance grid
+RESAMPLE_CHANNELS = ['Speed', 'Throttle', 'Brake', 'nGear', 'RPM', 'DRS']
+
+# Channels that hold discrete states and must not be linearly interpolated
+DISCRETE_CHANNELS = ['Brake', 'nGear', 'DRS']
+
+# Default spacing of the distance grid in metres
+DEFAULT_RESOLUTION = 5
+
+
+class ResampledLaps:
+    """Several laps aligned on one distance grid
+
+    ``channels`` maps each channel name to a contiguous (laps x grid points)
+    float array, ``time`` holds the elapsed lap time in seconds at every grid
+    point and ``delta`` the time difference to the reference lap.
+    """
+
+    def __init__(self, distance, channels, time, reference=0):
+        self.distance = distance
+        self.channels = channels
+        self.time = time
+        self.reference = reference
+        self.delta = np.ascontiguousarray(time - time[reference])
+
+    def __len__(self):
+        return self.time.shape[0]
+
+    @property
+    def distance_km(self):
+        return self.distance / 1000
+
+    def mini_sector_edges(self, n_sectors):
+        """Grid indexes splitting the common distance range into equally long mini-sectors"""
+        return np.linspace(0, len(self.distance) - 1, n_sectors + 1).round().astype(int)
+
+    def mini_sector_times(self, n_sectors):
+        """Time each lap spent in each mini-sector, shape (laps, n_sectors)"""
+        edges = self.mini_sector_edges(n_sectors)
+        return self.time[:, edges[1:]] - self.time[:, edges[:-1]]
+
+    def mini_sector_winners(self, n_sectors):
+        """Index of the quickest lap through each mini-sector"""
+        return np.argmin(self.mini_sector_times(n_sectors), axis=0)
+
+
+def _to_seconds(values):
+    if pd.api.types.is_timedelta64_dtype(values):
+        return values.dt.total_seconds().to_numpy(dtype=float)
+    return np.asarray(values, dtype=float)
+
+
+def resample_laps(telemetries, resolution=DEFAULT_RESOLUTION, channels=RESAMPLE_CHANNELS, reference=0):
+    """Put the telemetry of any number of laps onto a common distance grid
+
+    All laps are resampled in one batched interpolation: each lap's distance is
+    shifted by a per-lap offset so the concatenation of all laps is monotonic,
+    and the grid is shifted the same way. The grid spans the distance covered by
+    every lap.
+    """
+    if not telemetries:
+        raise ValueError("At least one lap is required for resampling")
+    channels = [ch for ch in channels if all(ch in tel.columns for tel in telemetries)]
+
+    # Distance must be non-decreasing within a lap for the interpolation to be valid
+    distances = [np.maximum.accumulate(np.asarray(tel['Distance'], dtype=float)) for tel in telemetries]
+    start = max(dist[0] for dist in distances)
+    stop = min(dist[-1] for dist in distances)
+    if stop <= start:
+        raise ValueError("Laps do not cover a common distance range")
+    grid = np.arange(start, stop, resolution)
+
+    n_laps, n_points = len(telemetries), len(grid)
+    offset = max(dist[-1] for dist in distances) - min(dist[0] for dist in distances) + resolution
+    lap_offsets = np.arange(n_laps)[:, None] * offset
+    x = np.concatenate([dist + i * offset for i, dist in enumerate(distances)])
+    queries = (grid[None, :] + lap_offsets).ravel()
+
+    # Previous-sample indexes for the discrete channels
+    previous = np.clip(np.searchsorted(x, queries, side='right') - 1, 0, len(x) - 1)
+
+    resampled = {}
+    for ch in channels + ['Time']:
+        values = np.concatenate([_to_seconds(tel[ch]) for tel in telemetries])
+        if ch in DISCRETE_CHANNELS:
+            result = values[previous]
+        else:
+            result = np.interp(queries, x, values)
+        resampled[ch] = np.ascontiguousarray(result.reshape(n_laps, n_points))
+
+    time = resampled.pop('Time')
+    return ResampledLaps(grid, resampled, time, reference=reference)
@@ -0,0 +1,125 @@
+import os
+import threading
+
+import pandas as pd
+
+from data_sources import get_data_source
+from utils import SEASONS
+
+# Compact columnar copy of the event schedules, next to the FastF1 cache
+INDEX_PATH = os.path.join('cache', 'schedule_index.parquet')
+
+_SESSION_COLUMNS = ['Session1', 'Session2', 'Session3', 'Session4', 'Session5']
+
+
+def default_index_path():
+    """Schedule index file of the active data source, so synthetic schedules never mix with real ones"""
+    name = get_data_source().name
+    if name == 'fastf1':
+        return INDEX_PATH
+    return os.path.join('cache', f"schedule_index_{name}.parquet")
+
+
+def fetch_schedule_frame(years):
+    """Fetch event schedules for the given years from the data source as one flat frame"""
+    frames = []
+    for year in years:
+        schedule = get_data_source().get_event_schedule(year)
+        frame = pd.DataFrame({
+            'Year': year,
+            'RoundNumber': schedule['RoundNumber'].astype('int16'),
+            'EventName': schedule['EventName'].astype(str),
+        })
+        for col in _SESSION_COLUMNS:
+            frame[col] = schedule[col].fillna('').astype(str) if col in schedule else ''
+        frames.append(frame)
+    frame = pd.concat(frames, ignore_index=True)
+    frame['Year'] = frame['Year'].astype('int16')
+    return frame
+
+
+class ScheduleIndex:
+    """Event schedules for several seasons with constant time lookups"""
+
+    def __init__(self, frame):
+        self.frame = frame.reset_index(drop=True)
+        self._event_names = {}
+        self._rounds = {}
+        self._sessions = {}
+
+        years = self.frame['Year'].to_numpy()
+        rounds = self.frame['RoundNumber'].to_numpy()
+        names = self.frame['EventName'].to_numpy()
+        sessions = self.frame[_SESSION_COLUMNS].to_numpy()
+        for year, round_number, name, event_sessions in zip(years, rounds, names, sessions):
+            year = int(year)
+            self._event_names.setdefault(year, []).append(name)
+            self._rounds[(year, name)] = int(round_number)
+            self._sessions[(year, name)] = [s for s in event_sessions if s]
+
+    @property
+    def years(self):
+        return list(self._event_names)
+
+    def event_names(self, year):
+        """Event names of a season in calendar order, empty for seasons without events"""
+        return self._event_names.get(int(year), [])
+
+    def round_number(self, year, event):
+        return self._rounds[(int(year), event)]
+
+    def sessions(self, year, event):
+        """Names of the sessions held at an event, e.g. ['Practice 1', ..., 'Race']"""
+        return self._sessions[(int(year), event)]
+
+    def save(self, path=INDEX_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        frame = self.frame.copy()
+        for col in ['EventName'] + _SESSION_COLUMNS:
+            frame[col] = frame[col].astype('category')
+        frame.to_parquet(path, index=False)
+
+    @classmethod
+    def read(cls, path=INDEX_PATH):
+        frame = pd.read_parquet(path)
+        for col in ['EventName'] + _SESSION_COLUMNS:
+            frame[col] = frame[col].astype(str)
+        return cls(frame)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+# Seasons the data source had no events for, e.g. not recorded for the replay source
+_empty_years = set()
+
+
+def get_schedule_index(years=SEASONS, path=None):
+    """Return the process-wide schedule index, building it on first use
+
+    Warm starts read the persisted index and never touch FastF1; only seasons
+    missing from the file are fetched and the file is rewritten.
+    """
+    global _index
+    path = path or default_index_path()
+    with _index_lock:
+        if _index is not None and set(years) <= set(_index.years) | _empty_years:
+            return _index
+
+        frame = pd.read_parquet(path) if os.path.exists(path) else None
+        known = _empty_years if frame is None else _empty_years | set(frame['Year'].astype(int))
+        missing = [year for year in years if year not in known]
+        if missing:
+            fetched = fetch_schedule_frame(missing)
+            _empty_years.update(set(missing) - set(fetched['Year'].astype(int)))
+            frame = fetched if frame is None else pd.concat(
+                [frame.astype({col: str for col in ['EventName'] + _SESSION_COLUMNS}), fetched],
+                ignore_index=True)
+            ScheduleIndex(frame).save(path)
+        _index = ScheduleIndex.read(path)
+        return _index
+
+
+def get_event_names(year):
+    """Common function to get the race names of a season for the race selectbox"""
+    return get_schedule_index().event_names(year)
@@ -0,0 +1,266 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from cache_manager import touch_session
+from data_sources import get_data_source
+from lap_table import get_lap_table, slim_laps
+from tracing import span
+
+# Memory ceiling for loaded sessions, overridable through the environment
+DEFAULT_MAX_MB = int(os.environ.get('F1_SESSION_CACHE_MB', '2048'))
+
+# Seconds a page waits for another thread's load of the same session before giving up
+DEFAULT_LOAD_TIMEOUT = float(os.environ.get('F1_LOAD_TIMEOUT', '300'))
+
+# Seconds between two updates of a session's last use on disk, see cache_manager.touch_session
+_TOUCH_INTERVAL = 60
+
+# Declarative load profiles; each page loads only the parts of a session it uses
+LOAD_PROFILES = {
+    'laps': {'laps': True, 'telemetry': False, 'weather': False, 'messages': False},
+    'telemetry': {'laps': True, 'telemetry': True, 'weather': False, 'messages': False},
+    'full': {'laps': True, 'telemetry': True, 'weather': True, 'messages': True},
+}
+
+# Session attributes that hold the bulk of a loaded session's memory
+_SESSION_DATA_ATTRS = ['_laps', '_results', '_weather_data', '_race_control_messages',
+                       '_track_status', '_session_status']
+_SESSION_TELEMETRY_ATTRS = ['_car_data', '_pos_data']
+
+
+def _frame_size(frame):
+    """Deep memory usage of a DataFrame in bytes"""
+    if isinstance(frame, pd.DataFrame):
+        return int(frame.memory_usage(deep=True, index=True).sum())
+    return 0
+
+
+def estimate_session_size(session):
+    """Estimate the in-memory size of a loaded FastF1 session in bytes
+
+    Only what the session holds counts, a released laps frame is not read
+    back for this. The session's lap table is counted with it.
+    """
+    attrs = vars(session)
+    size = 0
+    for attr in _SESSION_DATA_ATTRS:
+        size += _frame_size(attrs.get(attr))
+    for attr in _SESSION_TELEMETRY_ATTRS:
+        per_driver = attrs.get(attr) or {}
+        size += sum(_frame_size(frame) for frame in per_driver.values())
+    lap_table = attrs.get('_lap_table')
+    if lap_table is not None:
+        size += lap_table.nbytes
+    return size
+
+
+class _Flight:
+    """One in-progress load of a session, shared by every request for it that arrives meanwhile"""
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.done = threading.Event()
+        self.session = None
+        self.error = None
+
+
+class SessionCache:
+    """Process-wide LRU store of loaded FastF1 sessions shared by all pages
+
+    Loads are single-flight per session key: a request for a session that is
+    already being loaded waits for that load instead of starting another one,
+    and gets its session or its exception.
+    """
+
+    def __init__(self, max_mb=DEFAULT_MAX_MB, load_timeout=DEFAULT_LOAD_TIMEOUT):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.load_timeout = load_timeout
+        self._entries = OrderedDict()  # key -> {'session', 'parts', 'size', 'prefetched'}
+        self._lock = threading.RLock()
+        self._pending = {}  # key -> _Flight of the load in progress
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.upgrades = 0
+        self.coalesced = 0
+        self.load_errors = 0
+        self.timeouts = 0
+        self._touched = {}  # key -> time its last use was written to disk
+
+    @staticmethod
+    def make_key(year, event, session_type):
+        """Cache key for a session, independent of which parts of it are loaded"""
+        return (int(year), str(event), str(session_type))
+
+    @property
+    def current_bytes(self):
+        return sum(entry['size'] for entry in self._entries.values())
+
+    @property
+    def free_bytes(self):
+        return max(self.max_bytes - self.current_bytes, 0)
+
+    def put(self, key, session, parts, prefetched=False):
+        """Store a loaded session and evict least recently used ones over budget
+
+        A prefetched session stays low priority until a page uses it: it is
+        evicted before any session a page loaded and never displaces one.
+        """
+        with self._lock:
+            previous = self._entries.get(key)
+            self._entries[key] = {
+                'session': session,
+                'parts': set(parts),
+                'size': estimate_session_size(session),
+                'prefetched': prefetched and (previous is None or previous['prefetched']),
+            }
+            self._entries.move_to_end(key)
+            self._evict(keep=key)
+
+    def _touch(self, key, session):
+        # Keep the session's cached files at the back of the disk cache's eviction order
+        now = time.monotonic()
+        if now - self._touched.get(key, -_TOUCH_INTERVAL) >= _TOUCH_INTERVAL:
+            self._touched[key] = now
+            touch_session(session)
+
+    def _evict(self, keep=None):
+        # Prefetched sessions go first, least recently used first. The entry that was just added is kept
+        # even if it alone exceeds the budget, unless it is a prefetch, which is dropped instead of a page's session
+        while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+            victim = next((key for key, entry in self._entries.items()
+                           if entry['prefetched'] and key != keep), None)
+            if victim is None:
+                victim = next(iter(self._entries))
+                if keep in self._entries and self._entries[keep]['prefetched']:
+                    victim = keep
+                elif victim == keep:
+                    break
+            del self._entries[victim]
+            self.evictions += 1
+            if victim == keep:
+                break
+
+    def load(self, year, event, session_type, profile='full', prefetch=False):
+        """Return a session with the parts of the given load profile available
+
+        A cached session that is missing some parts is upgraded in place, so
+        e.g. a laps-only session gains telemetry without re-parsing lap data.
+        ``prefetch`` loads are stored at low priority, see ``put``.
+        """
+        options = LOAD_PROFILES[profile]
+        parts = {part for part, enabled in options.items() if enabled}
+        key = self.make_key(year, event, session_type)
+
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and parts <= entry['parts']:
+                    self._entries.move_to_end(key)
+                    if not prefetch:
+                        entry['prefetched'] = False
+                    self.hits += 1
+                    self._touch(key, entry['session'])
+                    return entry['session']
+                flight = self._pending.get(key)
+                if flight is None:
+                    flight = self._pending[key] = _Flight(parts)
+                    break
+                self.coalesced += 1
+            # Another thread (e.g. a prefetch worker) is loading this session, share its result
+            with span('wait_for_load'):
+                finished = flight.done.wait(self.load_timeout)
+            if not finished:
+                with self._lock:
+                    self.timeouts += 1
+                raise TimeoutError(f"Timed out after {self.load_timeout:g} s waiting for "
+                                   f"{year} {event} {session_type} to load")
+            if flight.error is not None:
+                raise flight.error
+            if parts <= flight.parts:
+                if not prefetch:
+                    self._promote(key)
+                return flight.session
+            # The finished load had fewer parts than this request needs, upgrade it
+
+        try:
+            # Parse outside the lock so one slow load does not block every other page
+            if entry is not None and 'laps' in entry['parts']:
+                session = entry['session']
+                with span('load_parts'):
+                    get_data_source().load_parts(session, parts - entry['parts'])
+                parts |= entry['parts']
+                with self._lock:
+                    self.upgrades += 1
+            else:
+                with span('fetch_session'):
+                    session = get_data_source().load_session(year, event, session_type, **options)
+                with self._lock:
+                    self.misses += 1
+            if 'laps' in parts:
+                # Index the laps once while still on the loading thread, pages then look laps up in O(1)
+                get_lap_table(session)
+                slim_laps(session)
+            self.put(key, session, parts, prefetched=prefetch)
+            self._touch(key, session)
+            flight.session, flight.parts = session, parts
+        except BaseException as e:
+            # Every request waiting on this load fails with the same error instead of retrying it
+            flight.error = e
+            with self._lock:
+                self.load_errors += 1
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(key)
+            flight.done.set()
+        return session
+
+    def _promote(self, key):
+        # A page uses a prefetched session, from now on it is evicted like any other
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry['prefetched'] = False
+
+    def contains(self, year, event, session_type, profile='full'):
+        """Whether a session is cached with all parts of a load profile, without touching the counters"""
+        parts = {part for part, enabled in LOAD_PROFILES[profile].items() if enabled}
+        with self._lock:
+            entry = self._entries.get(self.make_key(year, event, session_type))
+            return entry is not None and parts <= entry['parts']
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss/eviction counters and current memory usage"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'prefetched': sum(entry['prefetched'] for entry in self._entries.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'upgrades': self.upgrades,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._pending),
+                'load_errors': self.load_errors,
+                'timeouts': self.timeouts,
+                'size_mb': round(self.current_bytes / (1024 * 1024), 1),
+                'max_mb': round(self.max_bytes / (1024 * 1024), 1),
+            }
+
+
+# Module level instance so the cache survives Streamlit reruns and is shared by every page
+session_cache = SessionCache()
+
+
+def load_session(year, event, session_type, profile='full'):
+    """Common function to get a loaded session from the shared session cache"""
+    return session_cache.load(year, event, session_type, profile=profile)
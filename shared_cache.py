@@ -0,0 +1,202 @@
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import pyarrow as pa
+
+try:
+    import fcntl
+except ImportError:  # Windows, where replicas on one host are not supported
+    fcntl = None
+
+# Parsed and derived artifacts shared by every process on the host, point several
+# replicas at the same absolute path to let them reuse each other's work
+SHARED_CACHE_DIR = os.environ.get('F1_SHARED_CACHE_DIR', os.path.join('cache', 'shared'))
+
+# Bumped whenever the layout of a stored artifact changes, old entries are then never read
+FORMAT_VERSION = 2
+
+_SHAPES_METADATA_KEY = b'shapes'
+
+
+def key_digest(*key):
+    """Digest naming an artifact, from its kind and the inputs it was derived from"""
+    raw = json.dumps([FORMAT_VERSION, *key], default=str)
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
+def arrays_to_table(arrays):
+    """One-row Arrow table holding n-dimensional arrays, their shapes kept in the schema metadata"""
+    columns = {name: pa.ListArray.from_arrays([0, values.size], pa.array(np.ravel(values)))
+               for name, values in arrays.items()}
+    shapes = {name: list(values.shape) for name, values in arrays.items()}
+    table = pa.table(columns)
+    return table.replace_schema_metadata({_SHAPES_METADATA_KEY: json.dumps(shapes).encode()})
+
+
+def table_to_arrays(table):
+    """Arrays of ``arrays_to_table``, numeric ones are zero-copy views of a memory-mapped table"""
+    shapes = json.loads(table.schema.metadata[_SHAPES_METADATA_KEY])
+    arrays = {}
+    for name, shape in shapes.items():
+        values = table.column(name).chunk(0).flatten().to_numpy(zero_copy_only=False)
+        arrays[name] = values.reshape(shape)
+    return arrays
+
+
+class SharedCache:
+    """Content-addressed store of Arrow tables that several processes read and write safely
+
+    An artifact is written once to ``objects/<content hash>.arrow`` and found
+    through ``refs/<key digest>``, which holds that hash and the key. Both are written to a
+    temporary file and renamed into place, so readers never see a partial file
+    and need no lock. Builders take an exclusive lock per key, so two processes
+    asking for the same missing artifact build it only once. Objects are
+    memory-mapped, every process shares the page cache instead of its own copy.
+    """
+
+    def __init__(self, root=SHARED_CACHE_DIR):
+        self.root = root
+
+    def _path(self, kind, name):
+        return os.path.join(self.root, kind, name)
+
+    def _write_atomic(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # A unique temporary file, threads of one process may write the same object under different keys
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', prefix=f"{os.path.basename(path)}.",
+                                        dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        """Exclusive lock on a key across processes, held while its artifact is built"""
+        path = self._path('locks', f"{key_digest(*key)}.lock")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        while True:
+            f = open(path, 'a')
+            if fcntl is None:
+                break
+            fcntl.flock(f, fcntl.LOCK_EX)
+            # prune_locks may have deleted the file while this process waited, then lock the new one
+            try:
+                if os.path.samestat(os.fstat(f.fileno()), os.stat(path)):
+                    break
+            except FileNotFoundError:
+                pass
+            f.close()
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+
+    def prune_locks(self):
+        """Delete the lock files nobody holds, one is left behind by every key ever built"""
+        directory = self._path('locks', '')
+        if fcntl is None or not os.path.isdir(directory):
+            return
+        for name in os.listdir(directory):
+            if not name.endswith('.lock'):
+                continue
+            path = os.path.join(directory, name)
+            with open(path, 'a') as f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                # Removed while locked, a process that opened it meanwhile notices and locks a new file
+                os.remove(path)
+
+    def object_path(self, key):
+        """Path of the object a key refers to, None when it is not cached"""
+        try:
+            with open(self._path('refs', key_digest(*key))) as f:
+                digest = f.readline().strip()
+        except FileNotFoundError:
+            return None
+        path = self._path('objects', f"{digest}.arrow")
+        return path if os.path.exists(path) else None
+
+    def get(self, key):
+        """Memory-mapped table of a key, None when it is not cached or unreadable"""
+        path = self.object_path(key)
+        if path is None:
+            return None
+        try:
+            return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        except (OSError, pa.ArrowInvalid):
+            return None
+
+    def put(self, key, table):
+        """Store a table under a key; identical tables share one object"""
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        data = sink.getvalue().to_pybytes()
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        path = self._path('objects', f"{digest}.arrow")
+        try:
+            # An existing object is reused, marked recent so compaction does not take it before its ref is written
+            os.utime(path)
+        except FileNotFoundError:
+            self._write_atomic(path, data)
+        ref = f"{digest}\n{json.dumps([FORMAT_VERSION, *key], default=str)}\n"
+        self._write_atomic(self._path('refs', key_digest(*key)), ref.encode())
+        return path
+
+    def refs(self):
+        """(ref path, object path, key) of every stored key
+
+        The object path is None for refs of another format version or that
+        cannot be parsed, the key is then empty.
+        """
+        directory = self._path('refs', '')
+        if not os.path.isdir(directory):
+            return
+        for name in os.listdir(directory):
+            if name.endswith('.tmp'):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                with open(path) as f:
+                    digest = f.readline().strip()
+                    version, *key = json.loads(f.readline())
+            except (OSError, ValueError, TypeError):
+                yield path, None, []
+                continue
+            if version != FORMAT_VERSION:
+                yield path, None, []
+                continue
+            yield path, self._path('objects', f"{digest}.arrow"), key
+
+    def get_or_build(self, key, build):
+        """Cached table of a key, built by ``build()`` in at most one process at a time"""
+        table = self.get(key)
+        if table is not None:
+            return table
+        with self.lock(key):
+            # Another process may have built it while this one waited for the lock
+            table = self.get(key)
+            if table is None:
+                built = build()
+                self.put(key, built)
+                # Fall back to the built table if the stored one cannot be read back, e.g. removed meanwhile
+                table = self.get(key)
+                if table is None:
+                    table = built
+        return table
+
+
+# Module level instance shared by every page
+shared_cache = SharedCache()
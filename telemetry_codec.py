@@ -0,0 +1,247 @@
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Per-channel storage: dtype of the stored values, quantization scale and whether
+# consecutive differences are stored instead of the values. A value x is stored as
+# round(x * scale), so decoding is exact to 1 / scale:
+#   SessionTime, Time   1 ms        deltas
+#   Distance            1 cm        deltas
+#   X, Y, Z             1/10 unit   deltas (FastF1 positions are in 1/10 m, so 1 cm)
+#   Speed               0.01 km/h   uint16, up to 655.34 km/h
+#   RPM                 1 rpm       uint16
+#   Throttle            0.5 %       uint8, up to 127 %
+#   nGear, DRS          exact       int8 / uint8
+#   Brake               exact       bool
+# Missing samples of every channel decode as missing. RelativeDistance is not stored,
+# it is Distance divided by the lap's last Distance like FastF1 computes it, which
+# reproduces it to about 1e-6. ``round_trip_errors`` checks a lap against these bounds.
+CHANNEL_CODECS = {
+    'SessionTime': {'scale': 1e-6, 'delta': True},  # timedelta nanoseconds to milliseconds
+    'Time': {'scale': 1e-6, 'delta': True},
+    'Distance': {'scale': 100, 'delta': True},
+    'X': {'scale': 10, 'delta': True},
+    'Y': {'scale': 10, 'delta': True},
+    'Z': {'scale': 10, 'delta': True},
+    'Speed': {'dtype': np.uint16, 'scale': 100},
+    'RPM': {'dtype': np.uint16, 'scale': 1},
+    'Throttle': {'dtype': np.uint8, 'scale': 2},
+    'nGear': {'dtype': np.int8, 'scale': 1},
+    'DRS': {'dtype': np.uint8, 'scale': 1},
+    'Brake': {'dtype': np.bool_},
+}
+
+_TIME_CHANNELS = ['SessionTime', 'Time']
+
+# Column order of decoded frames, the order FastF1 produces them in
+_COLUMN_ORDER = ['SessionTime', 'Time', 'Distance', 'RelativeDistance', 'Speed', 'RPM',
+                 'nGear', 'Throttle', 'Brake', 'DRS', 'X', 'Y', 'Z', 'Distance_KM']
+
+_METADATA_KEY = b'telemetry_codec'
+
+
+def _delta_dtype(deltas):
+    """Narrowest signed integer type holding every difference"""
+    if not len(deltas):
+        return np.int16
+    low, high = deltas.min(), deltas.max()
+    for dtype in (np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return np.int64
+
+
+class EncodedTelemetry:
+    """A lap's telemetry as narrow integer arrays, about a fifth of the size of the decoded frame
+
+    ``columns`` holds one array per stored channel. ``meta`` holds the first
+    value of every delta-encoded channel, the positions of missing values of
+    each channel (stored as the previous value, or 0) and whether the frame had
+    a RelativeDistance column.
+    """
+
+    def __init__(self, columns, meta):
+        self.columns = columns
+        self.meta = meta
+
+    def __len__(self):
+        return self.meta['length']
+
+    @property
+    def nbytes(self):
+        return sum(values.nbytes for values in self.columns.values())
+
+    @classmethod
+    def encode(cls, telemetry):
+        columns = {}
+        meta = {'length': len(telemetry), 'bases': {}, 'missing': {},
+                'relative_distance': 'RelativeDistance' in telemetry.columns, 'channels': []}
+        for name, codec in CHANNEL_CODECS.items():
+            if name not in telemetry.columns:
+                continue
+            values = telemetry[name].to_numpy()
+            if name in _TIME_CHANNELS:
+                missing = np.isnat(values)
+                values = values.astype('timedelta64[ns]').astype(np.int64).astype(float)
+            elif codec.get('dtype') is np.bool_:
+                # astype(bool) alone would turn a NaN sample into True
+                missing = pd.isna(values)
+                if missing.any():
+                    meta['missing'][name] = np.flatnonzero(missing).tolist()
+                columns[name] = np.where(missing, False, values).astype(bool)
+                continue
+            else:
+                values = values.astype(float)
+                missing = np.isnan(values)
+
+            if missing.any():
+                meta['missing'][name] = np.flatnonzero(missing).tolist()
+                # Missing samples repeat the previous value, so they cost nothing in the deltas
+                values = pd.Series(np.where(missing, np.nan, values)).ffill().fillna(0).to_numpy()
+            quantized = np.round(values * codec['scale']).astype(np.int64)
+
+            if codec.get('delta'):
+                deltas = np.diff(quantized, prepend=quantized[:1])
+                meta['bases'][name] = int(quantized[0]) if len(quantized) else 0
+                columns[name] = deltas.astype(_delta_dtype(deltas))
+            else:
+                info = np.iinfo(codec['dtype'])
+                columns[name] = np.clip(quantized, info.min, info.max).astype(codec['dtype'])
+        meta['channels'] = list(columns)
+        return cls(columns, meta)
+
+    def decode(self):
+        """Frame of the lap's channels in FastF1's order, float X/Y/Z and the Distance_KM every page plots
+
+        Every column is its own read-only array, so an accidental in-place write raises.
+        """
+        arrays = {}
+        for name, codec in CHANNEL_CODECS.items():
+            if name not in self.columns:
+                continue
+            stored = self.columns[name]
+            missing = self.meta['missing'].get(name)
+            if codec.get('dtype') is np.bool_:
+                if missing:
+                    # Like pandas, a boolean channel with missing samples becomes float
+                    values = stored.astype(float)
+                    values[missing] = np.nan
+                    arrays[name] = values
+                else:
+                    arrays[name] = stored.astype(bool)
+                continue
+            if codec.get('delta'):
+                quantized = np.cumsum(stored, dtype=np.int64) + self.meta['bases'][name]
+            else:
+                quantized = stored.astype(np.int64)
+
+            if name in _TIME_CHANNELS:
+                values = (quantized * 1_000_000).astype('timedelta64[ns]')
+                if missing:
+                    values[missing] = np.timedelta64('NaT')
+            elif name in ('nGear', 'DRS') and not missing:
+                values = quantized
+            else:
+                values = quantized / codec['scale']
+                if missing:
+                    values[missing] = np.nan
+            arrays[name] = values
+
+        if self.meta['relative_distance'] and 'Distance' in arrays:
+            distance = arrays['Distance']
+            # Relative to the last known distance, NaN throughout when there is none or it is 0
+            known = distance[~np.isnan(distance)]
+            if len(known) and known[-1] > 0:
+                arrays['RelativeDistance'] = distance / known[-1]
+            else:
+                arrays['RelativeDistance'] = np.full(len(distance), np.nan)
+        if 'Distance' in arrays:
+            arrays['Distance_KM'] = arrays['Distance'] / 1000
+
+        arrays = {name: arrays[name] for name in _COLUMN_ORDER if name in arrays}
+        for values in arrays.values():
+            values.flags.writeable = False
+        # copy=False keeps one block per column instead of consolidating them into writable copies
+        return pd.DataFrame(arrays, copy=False)
+
+    def to_arrow(self):
+        """Arrow table of the stored arrays, ``meta`` kept in the schema metadata"""
+        table = pa.table({name: pa.array(values) for name, values in self.columns.items()})
+        return table.replace_schema_metadata({_METADATA_KEY: json.dumps(self.meta).encode()})
+
+    @classmethod
+    def from_arrow(cls, table, meta=None):
+        """Inverse of ``to_arrow``; ``meta`` is given for slices of a table holding several laps"""
+        if meta is None:
+            meta = json.loads(table.schema.metadata[_METADATA_KEY])
+        # A store holds every channel any of its laps has, a lap's own channels are listed in its meta
+        names = meta.get('channels', table.column_names)
+        columns = {name: table.column(name).to_numpy() for name in names}
+        return cls(columns, meta)
+
+
+def _channel_values(values, name):
+    # Float values of a channel for comparisons, times in nanoseconds, NaN where missing
+    if name in _TIME_CHANNELS:
+        return pd.to_timedelta(values).dt.total_seconds().to_numpy() * 1e9
+    return pd.Series(values).astype(float).to_numpy()
+
+
+def round_trip_errors(telemetry, encoded=None):
+    """Largest decoding error and the documented precision of every stored channel of a lap
+
+    Errors are in the units the channel is quantized from, nanoseconds for
+    times. A sample missing on one side only counts as an infinite error.
+    """
+    encoded = EncodedTelemetry.encode(telemetry) if encoded is None else encoded
+    decoded = encoded.decode()
+    errors = {}
+    for name, codec in CHANNEL_CODECS.items():
+        if name not in telemetry.columns:
+            continue
+        original = _channel_values(telemetry[name], name)
+        restored = _channel_values(decoded[name], name)
+        if (np.isnan(original) != np.isnan(restored)).any():
+            error = np.inf
+        else:
+            error = float(np.nanmax(np.abs(original - restored), initial=0))
+        # Rounding to the stored step loses at most half of it, booleans are exact
+        tolerance = 0.0 if codec.get('dtype') is np.bool_ else 0.5 / codec['scale']
+        errors[name] = (error, tolerance)
+    return errors
+
+
+def round_trip_failures(errors):
+    """Channels of ``round_trip_errors`` that do not decode within their documented precision"""
+    # The margin only absorbs float rounding of the comparison itself
+    return [name for name, (error, tolerance) in errors.items() if error > tolerance * (1 + 1e-9) + 1e-9]
+
+
+def main():
+    from data_sources import SyntheticSource
+    from telemetry_store import iter_lap_telemetry
+
+    # Every lap of a synthetic race, encoded and decoded again
+    session = SyntheticSource(n_drivers=4, n_laps=10).load_session(2024, 'Synthetic Grand Prix 1', 'R')
+    worst = {}
+    failed = 0
+    for driver, lap_number, telemetry in iter_lap_telemetry(session):
+        errors = round_trip_errors(telemetry)
+        failures = round_trip_failures(errors)
+        if failures:
+            failed += 1
+            print(f"{driver} lap {lap_number}: outside precision: {', '.join(failures)}")
+        for name, (error, tolerance) in errors.items():
+            worst[name] = (max(error, worst.get(name, (0, 0))[0]), tolerance)
+    for name, (error, tolerance) in worst.items():
+        print(f"{name:<12} max error {error:.6g}  allowed {tolerance:.6g}")
+    print(f"{failed} laps outside the documented precision")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,394 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from shared_cache import SHARED_CACHE_DIR, shared_cache
+from telemetry_codec import CHANNEL_CODECS, EncodedTelemetry, round_trip_errors, round_trip_failures
+from tracing import span
+
+_logger = logging.getLogger(__name__)
+
+# Precomputed per-lap telemetry, one Arrow IPC file per session shared by every process on the host
+STORE_DIR = os.path.join(SHARED_CACHE_DIR, 'telemetry')
+
+# Channels kept from the merged car/position telemetry
+TELEMETRY_CHANNELS = ['SessionTime', 'Time', 'Distance', 'RelativeDistance', 'Speed', 'RPM',
+                      'nGear', 'Throttle', 'Brake', 'DRS', 'X', 'Y', 'Z']
+
+_INDEX_METADATA_KEY = b'lap_index'
+_FINGERPRINT_METADATA_KEY = b'fingerprint'
+
+# Lap columns a session's data fingerprint is computed from
+_FINGERPRINT_COLUMNS = ['Driver', 'LapNumber', 'LapTime', 'Time']
+
+# Memory budget of the encoded per-lap telemetry shared by every page
+DEFAULT_TELEMETRY_CACHE_MB = int(os.environ.get('F1_TELEMETRY_CACHE_MB', '256'))
+
+# Memory budget of the most recently used laps kept decoded, so reruns do not decode them again
+DEFAULT_DECODED_TELEMETRY_CACHE_MB = int(os.environ.get('F1_DECODED_TELEMETRY_CACHE_MB', '64'))
+
+
+def session_id(session):
+    """Stable file name friendly identifier of a FastF1 session"""
+    raw = f"{session.event.year}_{session.event['EventName']}_{session.name}"
+    return re.sub(r'[^A-Za-z0-9]+', '_', raw).strip('_')
+
+
+def session_fingerprint(session):
+    """Digest of the data source and the lap timing of a session, computed once per session object
+
+    Part of every key of data derived from the session, so a session loaded
+    again from another source or with corrected timing data gets new entries
+    instead of stale ones. Only timed laps are hashed, they are the same
+    whichever other parts of the session are loaded.
+    """
+    fingerprint = vars(session).get('_fingerprint')
+    if fingerprint is None:
+        from data_sources import get_data_source
+
+        laps = pd.DataFrame(session.laps)
+        timed = laps.loc[laps['LapTime'].notna(), _FINGERPRINT_COLUMNS].astype({'Driver': str})
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(get_data_source().name.encode())
+        digest.update(pd.util.hash_pandas_object(timed, index=False).to_numpy().tobytes())
+        fingerprint = session._fingerprint = digest.hexdigest()
+    return fingerprint
+
+
+def session_key(session):
+    """Leading fields of every cache key of a session's derived data: its id and data fingerprint"""
+    return session_id(session), session_fingerprint(session)
+
+
+def store_path(session, store_dir=STORE_DIR):
+    return os.path.join(store_dir, f"{session_id(session)}.arrow")
+
+
+def _lap_key(driver, lap_number):
+    return f"{driver}:{int(lap_number)}"
+
+
+def iter_lap_telemetry(session):
+    """Yield (driver, lap number, telemetry frame) for every lap of a session
+
+    Car and position data are merged once per driver and then sliced per lap,
+    instead of merging again for every lap like ``Lap.get_telemetry()`` does.
+    """
+    laps = session.laps
+    for drv in session.drivers:
+        driver_laps = laps.pick_driver(drv)
+        driver_laps = driver_laps[driver_laps['LapStartTime'].notna() & driver_laps['Time'].notna()]
+        if driver_laps.empty:
+            continue
+        try:
+            pos_data = driver_laps.get_pos_data(pad=1, pad_side='both')
+            car_data = driver_laps.get_car_data(pad=1, pad_side='both')
+            merged = pos_data.merge_channels(car_data)
+        except (KeyError, ValueError):
+            # no telemetry available for this driver
+            continue
+
+        for _, lap in driver_laps.iterlaps():
+            telemetry = merged.slice_by_lap(lap, interpolate_edges=True)
+            if telemetry.empty:
+                continue
+            telemetry = telemetry.add_distance().add_relative_distance()
+            columns = [col for col in TELEMETRY_CHANNELS if col in telemetry.columns]
+            yield lap['Driver'], int(lap['LapNumber']), pd.DataFrame(telemetry[columns])
+
+
+def ingest_session(session, store_dir=STORE_DIR):
+    """Compute merged telemetry for every lap of a session and write it to the store
+
+    Processes ingesting the same session take turns, one that waited for
+    another's ingest to finish uses its store instead of writing it again.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    path = store_path(session, store_dir)
+    started = _mtime(path)
+    with shared_cache.lock(('ingest', path)):
+        if _mtime(path) != started:
+            _open_stores.pop(path, None)
+            return path
+        return _write_store(session, path)
+
+
+def _mtime(path):
+    return os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+
+def _write_store(session, path):
+    laps = []
+    index = {}
+    offset = 0
+    for driver, lap_number, telemetry in iter_lap_telemetry(session):
+        key = _lap_key(driver, lap_number)
+        if key in index:
+            # keep the first of several partial laps with the same number, like the pages do
+            continue
+        encoded = EncodedTelemetry.encode(telemetry)
+        # Ingest runs offline, so every lap is checked against the codec's documented precision
+        failures = round_trip_failures(round_trip_errors(telemetry, encoded))
+        if failures:
+            _logger.warning("%s lap %s of %s does not round trip within precision: %s",
+                            driver, lap_number, session_id(session), ', '.join(failures))
+        # Each lap's delta bases, missing samples and channels go to the index next to its rows
+        index[key] = [offset, len(encoded), encoded.meta]
+        offset += len(encoded)
+        laps.append(encoded)
+    if not laps:
+        raise ValueError(f"No telemetry data available for {session_id(session)}")
+
+    # Every channel any lap has, a lap without one gets zeros there and leaves it out of its channels.
+    # Concatenation widens a channel to the widest dtype any lap needed
+    channels = [name for name in CHANNEL_CODECS if any(name in lap.columns for lap in laps)]
+    table = pa.table({name: np.concatenate([
+        lap.columns[name] if name in lap.columns
+        else np.zeros(len(lap), dtype=CHANNEL_CODECS[name].get('dtype', np.int16))
+        for lap in laps]) for name in channels})
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        _INDEX_METADATA_KEY: json.dumps(index).encode(),
+        _FINGERPRINT_METADATA_KEY: session_fingerprint(session).encode(),
+    })
+
+    # Write to a temporary file first so readers never see a partial store
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+    _open_stores.pop(path, None)
+    return path
+
+
+class LapTelemetryStore:
+    """Memory-mapped per-lap telemetry of one session, indexed by (driver, lap number)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._source = pa.memory_map(path, 'r')
+        self._table = pa.ipc.open_file(self._source).read_all()
+        self._index = json.loads(self._table.schema.metadata[_INDEX_METADATA_KEY])
+        self.fingerprint = self._table.schema.metadata.get(_FINGERPRINT_METADATA_KEY, b'').decode()
+
+    def __contains__(self, key):
+        return _lap_key(*key) in self._index
+
+    def laps(self):
+        """All (driver, lap number) pairs in the store"""
+        return [(key.split(':')[0], int(key.split(':')[1])) for key in self._index]
+
+    def read_lap(self, driver, lap_number):
+        """Encoded telemetry of a single lap; only the mapped rows of that lap are touched"""
+        offset, length, *meta = self._index[_lap_key(driver, lap_number)]
+        rows = self._table.slice(offset, length)
+        if not meta:
+            # Stores ingested before the codec hold the plain channels
+            return EncodedTelemetry.encode(rows.to_pandas())
+        return EncodedTelemetry.from_arrow(rows, meta[0])
+
+
+_open_stores = {}
+_open_stores_lock = threading.Lock()
+
+
+def open_store(session, store_dir=STORE_DIR):
+    """Return the telemetry store of a session, or None if it has not been ingested from the same data"""
+    path = store_path(session, store_dir)
+    with _open_stores_lock:
+        if path not in _open_stores:
+            if not os.path.exists(path):
+                return None
+            _open_stores[path] = LapTelemetryStore(path)
+        store = _open_stores[path]
+    return store if store.fingerprint == session_fingerprint(session) else None
+
+
+def _nbytes(telemetry):
+    # Decoded frames hold plain numeric columns, encoded laps know their own size
+    if isinstance(telemetry, pd.DataFrame):
+        return int(telemetry.memory_usage(index=True).sum())
+    return telemetry.nbytes
+
+
+class TelemetryCache:
+    """Process-wide LRU store of lap telemetry keyed by (session, fingerprint, driver, lap number)
+
+    ``telemetry_cache`` keeps laps as ``EncodedTelemetry``, about a fifth of
+    the size of the decoded frames, so its budget holds five times as many
+    laps. ``decoded_telemetry_cache`` keeps the read-only frames of the laps
+    used most recently under a smaller budget.
+    """
+
+    def __init__(self, max_mb=DEFAULT_TELEMETRY_CACHE_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._entries = OrderedDict()  # key -> (encoded telemetry or decoded frame, size)
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, telemetry):
+        size = _nbytes(telemetry)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[1]
+            self._entries[key] = (telemetry, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'laps': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size_mb': round(self.current_bytes / 1024 / 1024, 1),
+                'max_mb': round(self.max_bytes / 1024 / 1024, 1),
+            }
+
+
+# Module level instances shared by every page
+telemetry_cache = TelemetryCache()
+decoded_telemetry_cache = TelemetryCache(DEFAULT_DECODED_TELEMETRY_CACHE_MB)
+
+
+def _read_lap_telemetry(session, lap, key, store):
+    """Encoded telemetry of a lap from the session's store, the shared cache or FastF1
+
+    Laps computed by FastF1 go to the shared cache, so other processes on the
+    host read them instead of merging the car and position data again.
+    """
+    if store is not None and key[2:] in store:
+        with span('read_lap'):
+            return store.read_lap(*key[2:])
+
+    def compute():
+        with span('get_telemetry'):
+            telemetry = lap.get_telemetry()
+        return EncodedTelemetry.encode(telemetry).to_arrow()
+
+    table = shared_cache.get_or_build(('lap_telemetry', *key), compute)
+    with span('read_lap'):
+        return EncodedTelemetry.from_arrow(table)
+
+
+def has_lap_telemetry(session, laps):
+    """Whether the telemetry of every lap is in the telemetry cache, the session's store or the shared cache
+
+    Pages load the car and position data of a session only when this is
+    False, the other laps are read without FastF1.
+    """
+    prefix = session_key(session)
+    store = open_store(session)
+    for lap in laps:
+        key = (*prefix, lap['Driver'], int(lap['LapNumber']))
+        if (key not in decoded_telemetry_cache and key not in telemetry_cache and (store is None or key[2:] not in store)
+                and shared_cache.object_path(('lap_telemetry', *key)) is None):
+            return False
+    return True
+
+
+def _decode(key, encoded):
+    with span('decode_lap'):
+        telemetry = encoded.decode()
+    decoded_telemetry_cache.put(key, telemetry)
+    return telemetry
+
+
+def get_lap_telemetry(session, lap):
+    """Common function to get a lap's telemetry
+
+    The returned frame is read-only, callers that need to modify it must copy
+    it first. Recently used laps are kept decoded, the others come from the
+    telemetry cache, then the store when the session is ingested, then the
+    shared cache or FastF1, and are decoded from the compact encoding of
+    ``telemetry_codec``.
+    """
+    key = (*session_key(session), lap['Driver'], int(lap['LapNumber']))
+    telemetry = decoded_telemetry_cache.get(key)
+    if telemetry is None:
+        encoded = telemetry_cache.get(key)
+        if encoded is None:
+            encoded = _read_lap_telemetry(session, lap, key, open_store(session))
+            telemetry_cache.put(key, encoded)
+        telemetry = _decode(key, encoded)
+    return telemetry
+
+
+def get_laps_telemetry(session, laps):
+    """Common function to get the telemetry of several laps in one pass
+
+    Cached laps are used as is, the rest are read from the session's store
+    (opened once for all of them), the shared cache or FastF1. Frames are
+    read-only like those of ``get_lap_telemetry``.
+    """
+    prefix = session_key(session)
+    keys = [(*prefix, lap['Driver'], int(lap['LapNumber'])) for lap in laps]
+    telemetries = [decoded_telemetry_cache.get(key) for key in keys]
+    missing = [i for i, telemetry in enumerate(telemetries) if telemetry is None]
+    encoded = {i: telemetry_cache.get(keys[i]) for i in missing}
+    unread = [i for i in missing if encoded[i] is None]
+    if unread:
+        store = open_store(session)
+        for i in unread:
+            encoded[i] = _read_lap_telemetry(session, laps[i], keys[i], store)
+            telemetry_cache.put(keys[i], encoded[i])
+    for i in missing:
+        telemetries[i] = _decode(keys[i], encoded[i])
+    return telemetries
+
+
+def main():
+    import fastf1
+    from session_cache import load_session
+
+    parser = argparse.ArgumentParser(description="Precompute per-lap telemetry for a session")
+    parser.add_argument('year', type=int)
+    parser.add_argument('event')
+    parser.add_argument('session', help="Session identifier, e.g. FP1, Q, R")
+    args = parser.parse_args()
+
+    os.makedirs('cache', exist_ok=True)
+    fastf1.Cache.enable_cache('cache')
+    session = load_session(args.year, args.event, args.session, profile='telemetry')
+    print(ingest_session(session))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import bisect
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import streamlit as st
+
+# JSON lines file every finished span is appended to, unset disables the log
+TRACE_LOG = os.environ.get('F1_TRACE_LOG')
+
+# Port of the Prometheus text endpoint, 0 disables it
+METRICS_PORT = int(os.environ.get('F1_METRICS_PORT', '0'))
+
+# Histogram bucket bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Page and session labels attached to every span started in the current script run
+_labels = contextvars.ContextVar('trace_labels', default={})
+
+
+class Tracer:
+    """Process-wide duration statistics of named spans, per page and session"""
+
+    def __init__(self, log_path=TRACE_LOG, buckets=BUCKETS):
+        self.log_path = log_path
+        self.buckets = buckets
+        self._stats = {}  # (span, page, session) -> [count, total seconds, cumulative bucket counts]
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, labels):
+        key = (name, labels.get('page', ''), labels.get('session', ''))
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = [0, 0.0, [0] * len(self.buckets)]
+            stats[0] += 1
+            stats[1] += seconds
+            for i in range(bisect.bisect_left(self.buckets, seconds), len(self.buckets)):
+                stats[2][i] += 1
+            if self.log_path:
+                with open(self.log_path, 'a') as f:
+                    f.write(json.dumps({'time': time.time(), 'span': name,
+                                        'seconds': round(seconds, 6), **labels}) + '\n')
+
+    def mean(self, name, page):
+        """Mean duration of a span on a page over every session, None before it was first recorded"""
+        with self._lock:
+            matches = [stats for (span, span_page, _), stats in self._stats.items()
+                       if span == name and span_page == page]
+        count = sum(stats[0] for stats in matches)
+        return sum(stats[1] for stats in matches) / count if count else None
+
+    def summary(self):
+        """Count and mean milliseconds per page and span, for the sidebar"""
+        totals = {}
+        with self._lock:
+            for (name, page, _), (count, total, _) in self._stats.items():
+                entry = totals.setdefault(f"{page or 'background'} / {name}", [0, 0.0])
+                entry[0] += count
+                entry[1] += total
+        return {key: {'count': count, 'mean_ms': round(1000 * total / count, 1)}
+                for key, (count, total) in sorted(totals.items())}
+
+    def prometheus(self):
+        """All spans as a Prometheus text format histogram"""
+        lines = ['# HELP f1_span_seconds Time spent in instrumented dashboard spans',
+                 '# TYPE f1_span_seconds histogram']
+        with self._lock:
+            items = sorted(self._stats.items())
+        for (name, page, session), (count, total, buckets) in items:
+            labels = f'span="{_escape(name)}",page="{_escape(page)}",session="{_escape(session)}"'
+            for bound, bucket_count in zip(self.buckets, buckets):
+                lines.append(f'f1_span_seconds_bucket{{{labels},le="{bound}"}} {bucket_count}')
+            lines.append(f'f1_span_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'f1_span_seconds_sum{{{labels}}} {total}')
+            lines.append(f'f1_span_seconds_count{{{labels}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Module level instance shared by every page
+tracer = Tracer()
+
+
+@contextlib.contextmanager
+def span(name, **labels):
+    """Time a block and record it under the page and session of the current script run"""
+    labels = {**_labels.get(), **labels}
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        tracer.record(name, time.perf_counter() - start, labels)
+
+
+@contextlib.contextmanager
+def trace_labels(**labels):
+    """Attach labels to every span started inside the block, e.g. for background threads"""
+    token = _labels.set({**_labels.get(), **labels})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+class PageProgress:
+    """Progress bar and status text advanced by the measured duration of each page stage
+
+    Each call to ``stage`` closes the previous stage's span and moves the bar to
+    the share of this page's usual render time spent before the new stage.
+    Stages that have not been measured yet weigh as much as the average stage.
+    """
+
+    def __init__(self, page, stages):
+        self.page = page
+        self.stages = stages
+        self.progress_bar = st.progress(0)
+        self.status_text = st.empty()
+        self._current = None
+        self._current_labels = None
+        self._start = None
+        self._token = _labels.set({'page': page})
+
+        means = {name: tracer.mean(name, page) for name in stages}
+        known = [mean for mean in means.values() if mean is not None]
+        default = sum(known) / len(known) if known else 1.0
+        weights = [default if means[name] is None else max(means[name], 1e-6) for name in stages]
+        total = sum(weights)
+        self._offsets = {}
+        elapsed = 0.0
+        for name, weight in zip(stages, weights):
+            self._offsets[name] = elapsed / total
+            elapsed += weight
+
+    def set_session(self, year, event, session_type):
+        """Label the spans of the following stages with the session being viewed"""
+        _labels.set({**_labels.get(), 'session': f"{year} {event} {session_type}"})
+
+    def stage(self, name, message):
+        self._finish_stage()
+        self.status_text.text(message)
+        self.progress_bar.progress(int(100 * self._offsets[name]))
+        self._current = name
+        self._current_labels = _labels.get()
+        self._start = time.perf_counter()
+
+    def _finish_stage(self):
+        if self._current is not None:
+            tracer.record(self._current, time.perf_counter() - self._start, self._current_labels)
+            self._current = None
+
+    def done(self):
+        self._finish_stage()
+        self.progress_bar.progress(100)
+        self.status_text.empty()
+        _labels.reset(self._token)
+
+    def clear(self):
+        """Remove the indicators after an error, the failed stage is not recorded"""
+        self._current = None
+        self.progress_bar.empty()
+        self.status_text.empty()
+        _labels.reset(self._token)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = tracer.prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve the spans at http://localhost:<port>/metrics, once per process"""
+    global _server
+    with _server_lock:
+        if _server is None and port:
+            _server = ThreadingHTTPServer(('', port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name='metrics', daemon=True).start()
+        return _server
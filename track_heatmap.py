@@ -0,0 +1,170 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from lap_table import get_lap_table
+from shared_cache import arrays_to_table, shared_cache, table_to_arrays
+from telemetry_store import session_key
+
+# Edge length of a grid cell in metres, FastF1 positions are in 1/10 m
+DEFAULT_CELL_SIZE = 20
+
+# Heat maps kept in memory, one per session and cell size, least recently used dropped first
+MAX_HEATMAPS = 16
+
+# Metrics a cell can be colored by
+HEATMAP_METRICS = {
+    'mean_gear': "Mean Gear",
+    'min_speed': "Minimum Speed (km/h)",
+    'brake_frequency': "Braking Frequency",
+}
+
+
+def driver_samples(session, drv):
+    """Car data samples of one driver on track with X/Y interpolated at the car data clock
+
+    Only samples between the start of the driver's first lap and the end of the
+    last one are kept, so garage and grid time does not show up on the map.
+    """
+    lap_table = get_lap_table(session)
+    abbreviation = session.get_driver(drv)['Abbreviation']
+    lap_starts = lap_table.column('LapStartTime', abbreviation)
+    lap_ends = lap_table.column('Time', abbreviation)
+    if np.isnan(lap_starts).all() or np.isnan(lap_ends).all():
+        return None
+    if drv not in session.car_data or drv not in session.pos_data:
+        return None
+    start = pd.Timedelta(seconds=float(np.nanmin(lap_starts)))
+    end = pd.Timedelta(seconds=float(np.nanmax(lap_ends)))
+    car = session.car_data[drv]
+    pos = session.pos_data[drv]
+    car = car[(car['SessionTime'] >= start) & (car['SessionTime'] <= end)]
+    if car.empty or pos.empty:
+        return None
+
+    car_time = car['SessionTime'].dt.total_seconds().to_numpy()
+    pos_time = pos['SessionTime'].dt.total_seconds().to_numpy()
+    return {
+        'X': np.interp(car_time, pos_time, pos['X'].to_numpy(dtype=float)),
+        'Y': np.interp(car_time, pos_time, pos['Y'].to_numpy(dtype=float)),
+        'nGear': car['nGear'].to_numpy(dtype=float),
+        'Speed': car['Speed'].to_numpy(dtype=float),
+        'Brake': car['Brake'].to_numpy(dtype=float),
+    }
+
+
+class TrackHeatmap:
+    """Gear, speed and braking statistics of a session binned on an X/Y grid
+
+    Sums and minimums are kept per driver, shape (drivers, nx, ny), so any
+    subset of drivers is combined without going back to the raw telemetry.
+    """
+
+    def __init__(self, drivers, x_edges, y_edges, counts, gear_sum, brake_sum, min_speed):
+        self.drivers = drivers
+        self.x_edges = x_edges
+        self.y_edges = y_edges
+        self.counts = counts
+        self.gear_sum = gear_sum
+        self.brake_sum = brake_sum
+        self.min_speed = min_speed
+
+    @classmethod
+    def from_session(cls, session, cell_size=DEFAULT_CELL_SIZE):
+        samples = {}
+        for drv in session.drivers:
+            data = driver_samples(session, drv)
+            if data is not None:
+                samples[session.get_driver(drv)['Abbreviation']] = data
+        if not samples:
+            raise ValueError("No position data available for this session")
+
+        # One grid over the whole field so per-driver arrays line up
+        cell = cell_size * 10
+        x_min = min(data['X'].min() for data in samples.values())
+        y_min = min(data['Y'].min() for data in samples.values())
+        nx = int((max(data['X'].max() for data in samples.values()) - x_min) // cell) + 1
+        ny = int((max(data['Y'].max() for data in samples.values()) - y_min) // cell) + 1
+
+        shape = (len(samples), nx * ny)
+        counts = np.zeros(shape, dtype=np.int32)
+        gear_sum = np.zeros(shape)
+        brake_sum = np.zeros(shape)
+        min_speed = np.full(shape, np.inf)
+        for i, data in enumerate(samples.values()):
+            cells = ((data['X'] - x_min) // cell).astype(int) * ny + ((data['Y'] - y_min) // cell).astype(int)
+            counts[i] = np.bincount(cells, minlength=nx * ny)
+            gear_sum[i] = np.bincount(cells, weights=data['nGear'], minlength=nx * ny)
+            brake_sum[i] = np.bincount(cells, weights=data['Brake'] > 0, minlength=nx * ny)
+            np.minimum.at(min_speed[i], cells, data['Speed'])
+
+        return cls(
+            drivers=list(samples),
+            x_edges=x_min + cell * np.arange(nx + 1),
+            y_edges=y_min + cell * np.arange(ny + 1),
+            counts=counts.reshape(-1, nx, ny),
+            gear_sum=gear_sum.reshape(-1, nx, ny),
+            brake_sum=brake_sum.reshape(-1, nx, ny),
+            min_speed=min_speed.reshape(-1, nx, ny),
+        )
+
+    def to_arrow(self):
+        return arrays_to_table({'drivers': np.array(self.drivers), 'x_edges': self.x_edges,
+                                'y_edges': self.y_edges, 'counts': self.counts, 'gear_sum': self.gear_sum,
+                                'brake_sum': self.brake_sum, 'min_speed': self.min_speed})
+
+    @classmethod
+    def from_arrow(cls, table):
+        arrays = table_to_arrays(table)
+        arrays['drivers'] = arrays['drivers'].tolist()
+        return cls(**arrays)
+
+    def aggregate(self, drivers=None):
+        """Per-cell metrics over the given drivers (all by default), NaN where nobody drove"""
+        rows = slice(None) if drivers is None else [self.drivers.index(drv) for drv in drivers]
+        counts = self.counts[rows].sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            metrics = {
+                'mean_gear': self.gear_sum[rows].sum(axis=0) / counts,
+                'min_speed': self.min_speed[rows].min(axis=0),
+                'brake_frequency': self.brake_sum[rows].sum(axis=0) / counts,
+            }
+        empty = counts == 0
+        for values in metrics.values():
+            values[empty] = np.nan
+        return metrics
+
+    @property
+    def x_centers(self):
+        return (self.x_edges[:-1] + self.x_edges[1:]) / 2
+
+    @property
+    def y_centers(self):
+        return (self.y_edges[:-1] + self.y_edges[1:]) / 2
+
+
+_heatmaps = OrderedDict()
+_heatmaps_lock = threading.Lock()
+
+
+def get_track_heatmap(session, cell_size=DEFAULT_CELL_SIZE, cache=shared_cache):
+    """Common function to get a session's track heat map, binning the telemetry only once
+
+    The binned arrays are memory-mapped from the shared cache, other processes
+    on the host reuse them instead of binning the session again.
+    """
+    key = (*session_key(session), cell_size)
+    with _heatmaps_lock:
+        heatmap = _heatmaps.get(key)
+        if heatmap is not None:
+            _heatmaps.move_to_end(key)
+    if heatmap is None:
+        heatmap = TrackHeatmap.from_arrow(cache.get_or_build(
+            ('track_heatmap', *key), lambda: TrackHeatmap.from_session(session, cell_size).to_arrow()))
+        with _heatmaps_lock:
+            _heatmaps[key] = heatmap
+            while len(_heatmaps) > MAX_HEATMAPS:
+                _heatmaps.popitem(last=False)
+    return heatmap
@@ -1,10 +1,25 @@
 import streamlit as st
 
+# Seasons offered by every page, newest first
+SEASONS = range(2024, 2017, -1)
+
+# Schedule session names mapped to the identifiers used by the pages
+SESSION_IDENTIFIERS = {
+    'Practice 1': 'FP1',
+    'Practice 2': 'FP2',
+    'Practice 3': 'FP3',
+    'Qualifying': 'Q',
+    'Sprint Shootout': 'SQ',
+    'Sprint Qualifying': 'SQ',
+    'Sprint': 'S',
+    'Race': 'R'
+}
+
 def get_year_selection(key_suffix=''):
     """Common function to get year selection with consistent range"""
     return st.sidebar.selectbox(
         "Select Year",
-        range(2024, 2017, -1),
+        SEASONS,
         key=f'year_{key_suffix}'
     )
 